@@ -0,0 +1,95 @@
+'''Contains detect_format_async function for DateSense package.
+Only imported on Python 3.6 and later, since it uses async generators.
+'''
+
+
+
+import asyncio
+
+from .DStoken import DStoken
+from .DSoptions import DSoptions
+
+
+
+# How many date strings detect_format_async culls before letting other coroutines run
+ASYNC_CHUNK_SIZE = 1024
+
+
+
+async def detect_format_async(dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None, budget=None, chunksize=ASYNC_CHUNK_SIZE):
+    '''Initialize and process everything for a data set that arrives from
+    an asynchronous source, like a network reader or a database cursor,
+    without keeping other coroutines from running for long. The date
+    strings are culled with DSoptions.cull_with_date_tokens a chunk at a
+    time, the same as detect_format would, and control is given back to
+    the event loop between chunks.
+    Returns a DSoptions object containing date format information.
+
+    :param dates: A set of identically-formatted date strings for which
+        the formatting should be detected. Can be an asynchronous iterable
+        of strings, a regular one, or a single string.
+    :param formatRules: (optional) See DSoptions.detect_format.
+    :param numOptions: (optional) See DSoptions.detect_format.
+    :param wordOptions: (optional) See DSoptions.detect_format.
+    :param tzOffsetDirective: (optional) See DSoptions.detect_format.
+    :param budget: (optional) See DSoptions.detect_format.
+    :param chunksize: (optional) How many date strings to cull before
+        giving control back to the event loop. Defaults to
+        ASYNC_CHUNK_SIZE.
+    '''
+    options = DSoptions.create_with_defaults(formatRules, numOptions, wordOptions, tzOffsetDirective)
+    # If it's just one string, turn it into a collection like the rest expects
+    if isinstance(dates, ("".__class__, u"".__class__)):
+        dates = [ dates ]
+    chunk = []
+    async for date in iterate_async(dates):
+        # Stop reading as soon as the sample budget runs out, instead of at the end of the chunk
+        if budget is not None and options.rows + len(chunk) >= budget:
+            options.exhausted = False
+            break
+        chunk.append(date)
+        if len(chunk) >= chunksize:
+            if not cull_chunk(options, chunk, budget):
+                chunk = []
+                break
+            chunk = []
+            await asyncio.sleep(0)
+    cull_chunk(options, chunk, budget)
+    options.cull_decorators()
+    options.process()
+    return options
+
+async def iterate_async(dates):
+    '''Iterate asynchronously over either an asynchronous iterable or a
+    regular one, so both can be read with the same async for loop.
+
+    :param dates: An asynchronous iterable or a regular iterable.
+    '''
+    if hasattr(dates, '__aiter__'):
+        async for date in dates:
+            yield date
+    else:
+        for date in dates:
+            yield date
+
+def cull_chunk(options, chunk, budget=None):
+    '''Seed and cull the token possibilities of a DSoptions object with a
+    list of date strings. If the possibilities haven't been seeded yet, the
+    first date string is used to seed them.
+    Returns False if the sample budget ran out, True otherwise.
+
+    :param options: The DSoptions object.
+    :param chunk: A list of date strings.
+    :param budget: (optional) See DSoptions.cull_with_dates.
+    '''
+    for date in chunk:
+        # Stop here if the sample budget ran out
+        if budget is not None and options.rows >= budget:
+            options.exhausted = False
+            return False
+        date_tokens = DStoken.tokenize_date_compact(date)
+        if options.rows:
+            options.cull_with_date_tokens(date_tokens)
+        else:
+            options.init_with_date_tokens(date_tokens)
+    return True
@@ -0,0 +1,78 @@
+'''Contains functions for detecting the formats of many columns of date
+strings at once for DateSense package.
+Columns are spread out over a pool of worker processes (or threads) using
+the concurrent.futures module. Columns are sent to the worker processes
+in batches, and the parser options are only pickled once per batch instead
+of along with every column.
+'''
+
+
+
+from .DSoptions import DSoptions
+
+
+
+def detect_column(column):
+    '''Detects the format for a single column. Used by worker processes in
+    detect_formats_for_columns.
+    Returns a (key, DSoptions) tuple.
+
+    :param column: A (config, key, dates) tuple, where config is a
+        (formatRules, numOptions, wordOptions, tzOffsetDirective) tuple.
+    '''
+    config, key, dates = column
+    return key, DSoptions.detect_format(dates, *config)
+
+def detect_formats_for_columns(columns, workers=None, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None, threads=False):
+    '''Detect the format of each of many columns of date strings in
+    parallel. Each column is assumed to contain identically-formatted date
+    strings, same as for DSoptions.detect_format.
+    Returns a dict mapping each column's key to a DSoptions object
+    containing date format information for that column.
+
+    :param columns: A dict mapping column keys (like column names) to sets
+        of date strings, or an iterable of (key, dates) tuples. When using
+        worker processes, columns that aren't lists or tuples are read into
+        lists before being sent to the workers.
+    :param workers: (optional) The number of worker processes or threads to
+        use. If set to 1 the columns are processed one after the other
+        without starting a pool. Defaults to None, meaning the number of
+        processors.
+    :param formatRules: (optional) See DSoptions.detect_format.
+    :param numOptions: (optional) See DSoptions.detect_format.
+    :param wordOptions: (optional) See DSoptions.detect_format.
+    :param tzOffsetDirective: (optional) See DSoptions.detect_format.
+    :param threads: (optional) If True, use a pool of threads instead of a
+        pool of processes. Threads avoid the cost of sending columns and
+        results between processes, but because of the global interpreter
+        lock they won't run the parser on more than one core at a time.
+        Defaults to False.
+    '''
+
+    # Handle default values for various options
+    options = DSoptions.create_with_defaults(formatRules, numOptions, wordOptions, tzOffsetDirective)
+    config = (options.formatrules, options.numoptions, options.wordoptions, options.tzoffsetdirective)
+
+    # Get the columns as a list of (key, dates) tuples
+    if hasattr(columns, 'items'):
+        columns = columns.items()
+    columns = list(columns)
+
+    # Just do it here if there's only one worker
+    if workers == 1:
+        return dict([(key, DSoptions.detect_format(dates, *config)) for key, dates in columns])
+
+    # Otherwise start a pool and fan the columns out to it
+    import concurrent.futures
+    import multiprocessing
+    workers = workers if workers else multiprocessing.cpu_count()
+    if threads:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(key, executor.submit(DSoptions.detect_format, dates, *config)) for key, dates in columns]
+            return dict([(key, future.result()) for key, future in futures])
+    else:
+        # Every column shares the same config tuple, so pickling a batch of them only includes it once
+        columns = [(config, key, dates if isinstance(dates, (list, tuple, "".__class__, u"".__class__)) else list(dates)) for key, dates in columns]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(columns) // (4 * workers))
+            return dict(executor.map(detect_column, columns, chunksize=chunksize))
@@ -0,0 +1,200 @@
+'''Contains DSbitset class for DateSense package.'''
+
+
+
+from .DStoken import DStoken
+
+
+
+class DSbitset(object):
+    '''A DSbitset object is a compact culling engine for a DSoptions object.
+    Rather than a list of DStoken objects, each position holds an integer
+    with a bit set for each directive that's still possible there, plus the
+    decorator text if that's still possible too. Every numeric directive,
+    alphabetical directive and the timezone offset directive of the
+    DSoptions object gets its own bit, and culling a position with a value
+    is just a bitwise AND with the bits of the directives that accept it,
+    which are found using the DSoptions object's NumIndex and WordIndex.
+    Once culling is done, materialize writes the result back to the
+    DSoptions object as the usual lists of DStoken objects, so applying the
+    rules and everything else works as before. The possibilities, numranges,
+    rows and stablerows end up exactly the same as culling the DSoptions
+    object directly.
+    '''
+
+    # Const for the most distinct words whose bits are remembered
+    WORD_MASK_CACHE_SIZE = 65536
+
+    def __init__(self, options):
+        '''Constructs a DSbitset object.
+        Returns the DSbitset object.
+
+        :param options: The DSoptions object to cull possibilities for.
+        '''
+        self.options = options
+        self.vocabulary = []
+        '''The directive for each bit: a NumOption or WordOption object, or
+        the timezone offset directive string for the last bit.'''
+        self.wordbits = {}
+        self.vocabulary.extend(options.numoptions)
+        for option in options.wordoptions:
+            self.wordbits[option] = self.wordbits.get(option, 0) | (1 << len(self.vocabulary))
+            self.vocabulary.append(option)
+        self.tzbit = 1 << len(self.vocabulary)
+        self.vocabulary.append(options.tzoffsetdirective)
+        self.allnumbits = self.tzbit - 1 - sum(self.wordbits.values())
+
+        # Numeric directives come first, in the same order as in the NumIndex, so its bitmasks can be used as-is
+        self.numindex = options.get_num_index()
+        self.wordindex = options.get_word_index()
+        self.wordmasks = {}
+
+        self.masks = []
+        '''The bits of the directives possible at each position.'''
+        self.decorators = []
+        '''The decorator text possible at each position, or None if a
+        decorator isn't possible there anymore.'''
+        self.numranges = []
+        '''The same as the numranges attribute of DSoptions objects.'''
+        self.rows = 0
+        self.stablerows = 0
+        self.exhausted = True
+
+    def get_mask(self, kind, text):
+        '''Returns the bits for the directives that accept a token.'''
+        if kind == DStoken.KIND_NUMBER:
+            return self.numindex.get_mask(int(text))
+        elif kind == DStoken.KIND_WORD:
+            mask = self.wordmasks.get(text)
+            if mask is None:
+                mask = 0
+                for option in self.wordindex.get_options(text):
+                    mask |= self.wordbits[option]
+                if len(self.wordmasks) < DSbitset.WORD_MASK_CACHE_SIZE:
+                    self.wordmasks[text] = mask
+            return mask
+        elif kind == DStoken.KIND_TIMEZONE:
+            return self.tzbit
+        return 0
+
+
+
+    def initialize(self, dates, budget=None):
+        '''Initialize the possibilities with the first date string and cull
+        them with the rest, same as DSoptions.initialize but without culling
+        decorators or writing the result back to the DSoptions object. (See
+        materialize.)
+
+        :param dates: A set of identically-formatted date strings. Can be any
+            iterable of strings.
+        :param budget: (optional) See DSoptions.cull_with_dates.
+        '''
+        dates = iter(dates)
+        first = next(dates, None)
+        if first is None:
+            return
+        self.init_with_date_tokens(DStoken.tokenize_date_compact(first))
+        self.cull_with_dates(dates, budget)
+
+    def init_with_date_tokens(self, date_tokens):
+        '''Seed the possibilities with a tokenized date string, same as
+        DSoptions.init_with_date_tokens.
+
+        :param date_tokens: A list of (kind, text) tuples returned by
+            DStoken.tokenize_date_compact, or DStoken objects.
+        '''
+        for kind, text in DStoken.get_kinds_and_texts(date_tokens):
+            mask = self.get_mask(kind, text)
+            self.masks.append(mask)
+            self.decorators.append(text)
+            self.numranges.append([int(text), int(text)] if mask & self.allnumbits else None)
+        self.rows += 1
+
+    def cull_with_dates(self, dates, budget=None):
+        '''Cull the possibilities with a set of date strings, same as
+        DSoptions.cull_with_dates.
+
+        :param dates: A set of identically-formatted date strings. Can be any
+            iterable of strings.
+        :param budget: (optional) See DSoptions.cull_with_dates.
+        '''
+        for date in dates:
+            # Stop here if the sample budget ran out
+            if budget is not None and self.rows >= budget:
+                self.exhausted = False
+                break
+            self.cull_with_date_tokens(DStoken.tokenize_date_compact(date))
+
+    def cull_with_date_tokens(self, date_tokens):
+        '''Cull the possibilities with a single tokenized date string, same as
+        DSoptions.cull_with_date_tokens.
+        Returns the number of possibilities that were removed.
+
+        :param date_tokens: A list of (kind, text) tuples returned by
+            DStoken.tokenize_date_compact, or DStoken objects.
+        '''
+        date_tokens = DStoken.get_kinds_and_texts(date_tokens)
+        masks = self.masks
+        decorators = self.decorators
+        removed = 0
+        for i in range(0,min(len(masks),len(date_tokens))):
+            kind, text = date_tokens[i]
+            mask = masks[i]
+            culled = mask & self.get_mask(kind, text)
+            if culled != mask:
+                removed += bin(mask ^ culled).count('1')
+                masks[i] = culled
+            if decorators[i] is not None and decorators[i] != text:
+                decorators[i] = None
+                removed += 1
+            # Widen the range of numbers seen here if any numeric directive accepted this one
+            if culled & self.allnumbits:
+                number = int(text)
+                numrange = self.numranges[i]
+                numrange[0] = min(number,numrange[0])
+                numrange[1] = max(number,numrange[1])
+        self.rows += 1
+        if removed:
+            self.stablerows = 0
+        else:
+            self.stablerows += 1
+        return removed
+
+
+
+    def get_counts(self):
+        '''Returns the number of possibilities at each position.'''
+        return [bin(self.masks[i]).count('1') + (self.decorators[i] is not None) for i in range(0,len(self.masks))]
+
+    def get_token_lists(self):
+        '''Returns a list of DStoken objects for each position, in the same
+        order DSoptions.init_with_date_tokens would have created them.'''
+        allowed = []
+        for i in range(0,len(self.masks)):
+            mask = self.masks[i]
+            allowhere = []
+            if self.decorators[i] is not None:
+                allowhere.append(DStoken.create_decorator(self.decorators[i]))
+            for j in range(0,len(self.vocabulary)):
+                if mask & (1 << j):
+                    if (1 << j) == self.tzbit:
+                        allowhere.append(DStoken.create_timezone(self.vocabulary[j]))
+                    elif (1 << j) & self.allnumbits:
+                        allowhere.append(DStoken.create_number(self.vocabulary[j]))
+                    else:
+                        allowhere.append(DStoken.create_word(self.vocabulary[j]))
+            allowed.append(allowhere)
+        return allowed
+
+    def materialize(self):
+        '''Write the possibilities back to the DSoptions object as lists of
+        DStoken objects, along with numranges, rows, stablerows and
+        exhausted.
+        Returns the DSoptions object.
+        '''
+        self.options.allowed = self.get_token_lists()
+        self.options.numranges = [list(numrange) if numrange else None for numrange in self.numranges]
+        self.options.rows = self.rows
+        self.options.stablerows = self.stablerows
+        self.options.exhausted = self.exhausted
+        return self.options
@@ -0,0 +1,97 @@
+'''Contains DSFormatCache class for DateSense package.'''
+
+
+
+from collections import OrderedDict
+import threading
+
+
+
+class DSFormatCache(object):
+    '''A DSFormatCache object remembers the results of processing culled
+    token possibility data, so that detecting the format of data that looks
+    just like something that's been seen before doesn't need to apply all
+    the rules again.
+    Results are keyed by the fingerprint of the culled data (see
+    DSoptions.get_fingerprint) along with the identity of the rule, option
+    and timezone offset directive objects and the duplicate penalty used to
+    process it. Since rules and options are compared by identity, changing
+    the attributes of a rule or option object after it's been used won't be
+    noticed by the cache; create a new one instead.
+    When the cache is full, the least recently used result is discarded.
+    Pass a DSFormatCache object to DSoptions.detect_format or
+    DSoptions.process to use it. It's safe to share one between threads.
+    '''
+
+    def __init__(self, maxsize=1024):
+        '''Constructs a DSFormatCache object.
+        Returns the DSFormatCache object.
+
+        :param maxsize: (optional) The most results the cache will hold.
+            Defaults to 1024.
+        '''
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        '''The number of lookups that found a cached result.'''
+        self.misses = 0
+        '''The number of lookups that didn't.'''
+        self.lock = threading.Lock()
+
+    def get_key(self, options, dupepenalty):
+        '''Returns the key used to store the results for a DSoptions object.'''
+        return (
+            options.get_fingerprint(),
+            tuple(options.formatrules), tuple(options.numoptions), tuple(options.wordoptions),
+            options.tzoffsetdirective, dupepenalty
+        )
+
+    def lookup(self, options, dupepenalty):
+        '''Look for a cached result for a DSoptions object. If there is one,
+        the scores of its token possibilities are set accordingly.
+        Returns True if a cached result was found, False otherwise.
+
+        :param options: A DSoptions object that's been initialized but not
+            processed.
+        :param dupepenalty: The duplicate penalty it would be processed with.
+        '''
+        key = self.get_key(options, dupepenalty)
+        with self.lock:
+            scores = self.entries.pop(key, None)
+            if scores is None:
+                self.misses += 1
+                return False
+            self.entries[key] = scores # Move it to the most recently used end
+            self.hits += 1
+        options.set_scores(scores)
+        return True
+
+    def store(self, options, dupepenalty):
+        '''Store the result of processing a DSoptions object.
+
+        :param options: A DSoptions object that's just been processed.
+        :param dupepenalty: The duplicate penalty it was processed with.
+        '''
+        key = self.get_key(options, dupepenalty)
+        scores = options.get_scores()
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = scores
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        '''Discard all cached results and reset the hit and miss counters.'''
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        '''Returns a dict with the number of hits, misses, and cached results
+        ('hits', 'misses', 'size') and the maximum size ('maxsize').'''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,155 @@
+'''Contains DSRuleMemo class for DateSense package.'''
+
+
+
+from collections import OrderedDict
+import numbers
+import threading
+
+
+
+class DSRuleMemo(object):
+    '''Rule memos remember how applying each rule changed the scores of
+    the token possibilities, so that applying it again to possibilities
+    it's already seen can be done by just repeating those changes.
+    Which possibilities are where, numranges, and the current scores are
+    the things a rule can depend on, and each rule says which of them it
+    does depend on with its inputs attribute: a tuple containing any of
+    'allowed', 'numranges' and 'scores'. For example DSDelimiterRule and
+    DSLikelyRangeRule don't look at scores, so their changes can be reused
+    even after the scores from the rules before them have changed, while
+    DSPatternRule and DSMutExclusionRule only reuse their changes when the
+    scores are the same as well. Rules without an inputs attribute are
+    always applied, and so are rules whose changes to scores aren't whole
+    numbers, since adding them to other scores again might not give exactly
+    the same result as applying the rule.
+    Pass a DSRuleMemo object to DSoptions.process or apply_rules to use it,
+    and keep using the same one for the same rules. (Or call start, then
+    apply for each rule.) Like DSFormatCache, rules are told apart by
+    identity, so changing the attributes of a rule after it's been used
+    won't be noticed; create a new one instead. It's safe to share one
+    between threads.
+    '''
+
+    NOT_REUSABLE = object()
+    '''Stands in for the changes made by a rule when they can't be reused.'''
+
+    def __init__(self, maxsize=1024):
+        '''Constructs a DSRuleMemo object.
+        Returns the DSRuleMemo object.
+
+        :param maxsize: (optional) The most sets of changes remembered. When
+            there are more, the least recently used ones are discarded.
+            Defaults to 1024.
+        '''
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        '''Maps a rule and its inputs to the changes it made to scores, as
+        (position, index, change) tuples.'''
+        self.ids = {}
+        '''Maps the inputs that have been seen to small integers, so that
+        looking up the changes for each rule doesn't mean hashing all the
+        possibilities again.'''
+        self.nextid = 0
+        self.hits = 0
+        '''The number of times a rule's changes were reused.'''
+        self.misses = 0
+        '''The number of times a rule with inputs had to be applied.'''
+        self.lock = threading.Lock()
+
+    def get_id(self, value):
+        '''Returns the integer standing for some inputs. Must be called with
+        the lock held.'''
+        valueid = self.ids.get(value)
+        if valueid is None:
+            # Start over rather than let the ids pile up forever; ids aren't reused, so any still in use just won't match anything
+            if len(self.ids) >= self.maxsize * 4:
+                self.ids.clear()
+                self.entries.clear()
+            valueid = self.nextid
+            self.nextid += 1
+            self.ids[value] = valueid
+        return valueid
+
+    def start(self, options):
+        '''Call this before applying rules to a DSoptions object with apply.
+        Returns a dict of the ids for its current inputs, which is passed to
+        apply and kept up to date as rules change the scores.
+
+        :param options: The DSoptions object the rules will be applied to.
+        '''
+        fingerprint = options.get_fingerprint()
+        scores = options.get_scores()
+        with self.lock:
+            return {
+                'allowed': self.get_id(fingerprint[0]),
+                'numranges': self.get_id(fingerprint[1]),
+                'scores': self.get_id(scores)
+            }
+
+    def apply(self, rule, options, inputids):
+        '''Applies a rule to a DSoptions object, reusing the changes it made
+        last time it was applied to the same inputs if there are any.
+
+        :param rule: A rule object.
+        :param options: The DSoptions object to apply it to.
+        :param inputids: The dict returned by start.
+        '''
+        names = getattr(rule, 'inputs', None)
+        if names is None:
+            rule.apply(options)
+            scores = options.get_scores()
+            with self.lock:
+                inputids['scores'] = self.get_id(scores)
+            return
+        key = (rule, tuple([inputids[name] for name in names]))
+        with self.lock:
+            changes = self.entries.pop(key, None)
+            if changes is not None and changes is not self.NOT_REUSABLE:
+                self.entries[key] = changes # Move it to the most recently used end
+                self.hits += 1
+            else:
+                self.misses += 1
+        if changes is not None and changes is not self.NOT_REUSABLE:
+            for i, j, change in changes:
+                options.allowed[i][j].score += change
+        else:
+            # Apply the rule and work out what it changed
+            scores = options.get_scores()
+            rule.apply(options)
+            changes = []
+            for i in range(0,len(options.allowed)):
+                toklist = options.allowed[i]
+                for j in range(0,len(toklist)):
+                    if toklist[j].score != scores[i][j]:
+                        changes.append((i, j, toklist[j].score - scores[i][j]))
+            changes = tuple(changes)
+            # Adding a change that isn't a whole number might not give exactly the same score as applying the rule
+            for i, j, change in changes:
+                if not isinstance(change, numbers.Integral):
+                    changes = self.NOT_REUSABLE
+                    break
+        with self.lock:
+            self.entries[key] = changes
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            # The scores now are the ones before plus these changes, so that's enough to identify them
+            if changes is self.NOT_REUSABLE:
+                inputids['scores'] = self.get_id(options.get_scores())
+            elif changes:
+                inputids['scores'] = self.get_id((inputids['scores'], key))
+
+    def clear(self):
+        '''Forget all the remembered changes and reset the hit and miss counters.'''
+        with self.lock:
+            self.entries.clear()
+            self.ids.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        '''Returns a dict with the number of hits and misses ('hits',
+        'misses'), the number of sets of changes remembered ('size') and the
+        maximum ('maxsize').'''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
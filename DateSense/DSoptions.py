@@ -11,8 +11,14 @@ examples and thorough descriptions of how things work.
 
 
 
+import bisect
+import itertools
+
 from .DStoken import DStoken
 from .DSrule import *
+from .DSparser import DSparser
+from .DSbitset import DSbitset
+from .DSmemo import DSRuleMemo
 
 
 
@@ -30,6 +36,15 @@ class DSoptions(object):
     UNCOMMON = 1
     COMMON = 2 
     
+    # Const for the most distinct values remembered per cache when culling with dedupe enabled
+    DEDUPE_CACHE_SIZE = 65536
+    
+    # Const for how many date strings in a row have to leave the possibilities unchanged before they're considered stable
+    CONVERGENCE_ROWS = 256
+    
+    # Const for how many date strings are culled at once with columnar culling enabled
+    COLUMN_CHUNK_SIZE = 4096
+    
     
     
     class NumOption(object):
@@ -91,6 +106,117 @@ class DSoptions(object):
             else:
                 return value_lower in self.words
     
+    class NumIndex(object):
+        '''Maps numbers to the NumOption objects they're valid for, so that
+        a number token can be checked against every numeric directive with
+        one binary search instead of calling includesvalue for each one.
+        The ends of the ranges of all the NumOption objects divide the
+        numbers into intervals, and each interval has a bitmask with a bit
+        set for each NumOption that accepts the numbers in it. The results
+        are exactly the same as calling includesvalue. Objects of NumOption
+        subclasses, and NumOption objects with ranges that aren't integers,
+        are checked by calling includesvalue instead.
+        '''
+        def __init__(self, numoptions):
+            '''Constructs a NumIndex object.
+            Returns the NumIndex object.
+            
+            :param numoptions: A set of NumOption objects.
+            '''
+            self.numoptions = tuple(numoptions)
+            self.bits = {}
+            '''Maps each NumOption object to its bit in the bitmasks.'''
+            self.unindexed = []
+            boundaries = set()
+            for j in range(0,len(self.numoptions)):
+                option = self.numoptions[j]
+                self.bits[option] = self.bits.get(option, 0) | (1 << j)
+                if type(option) is DSoptions.NumOption and all(isinstance(bound, int) for bound in option.numrange):
+                    boundaries.add(option.numrange[0])
+                    boundaries.add(option.numrange[1] + 1)
+                else:
+                    self.unindexed.append(option)
+            self.boundaries = sorted(boundaries)
+            '''The numbers where each interval starts, in ascending order.'''
+            self.masks = []
+            '''The bitmask for each interval. The one at index 0 is for numbers
+            lower than the first boundary, and the one at index k is for
+            numbers from boundaries[k-1] up to but not including boundaries[k].'''
+            for start in [self.boundaries[0] - 1 if self.boundaries else 0] + self.boundaries:
+                mask = 0
+                for option in self.numoptions:
+                    if option not in self.unindexed and option.includesvalue(start):
+                        mask |= self.bits[option]
+                self.masks.append(mask)
+                
+        def get_mask(self, value):
+            '''Returns the bitmask of the NumOption objects the value is valid for.'''
+            mask = self.masks[bisect.bisect_right(self.boundaries, value)]
+            for option in self.unindexed:
+                if option.includesvalue(value):
+                    mask |= self.bits[option]
+            return mask
+            
+        def get_options(self, value):
+            '''Returns a tuple of the NumOption objects the value is valid for.'''
+            mask = self.get_mask(value)
+            return tuple([option for option in self.numoptions if self.bits[option] & mask])
+            
+        def includesvalue(self, option, value, mask):
+            '''Returns true if the value is valid for a NumOption, false
+            otherwise, given the bitmask returned by get_mask for the value.'''
+            bit = self.bits.get(option)
+            if bit is None:
+                return option.includesvalue(value)
+            return bool(bit & mask)
+            
+        def isinterval(self, option):
+            '''Returns true if the NumOption is known to accept every integer
+            from the lowest to the highest one it accepts, which is the case
+            for the ones checked with the bitmasks, false otherwise.'''
+            return option in self.bits and option not in self.unindexed
+    
+    class WordIndex(object):
+        '''Maps words to the WordOption objects they're valid for, so that a
+        word token can be checked against every alphabetical directive with
+        one dict lookup instead of calling includesvalue for each one.
+        Every word of each WordOption is indexed, and so is every prefix of
+        it at least matchlength characters long. The results are exactly the
+        same as calling includesvalue. Objects of WordOption subclasses are
+        checked by calling their includesvalue method instead, in case it
+        works differently.
+        '''
+        def __init__(self, wordoptions):
+            '''Constructs a WordIndex object.
+            Returns the WordIndex object.
+            
+            :param wordoptions: A set of WordOption objects.
+            '''
+            self.wordoptions = tuple(wordoptions)
+            self.unindexed = [option for option in self.wordoptions if type(option) is not DSoptions.WordOption]
+            matches = {}
+            for option in self.wordoptions:
+                if type(option) is not DSoptions.WordOption:
+                    continue
+                for word in option.words:
+                    prefixes = set([word])
+                    if option.matchlength:
+                        prefixes.update([word[:length] for length in range(option.matchlength,len(word))])
+                    for prefix in prefixes:
+                        matches.setdefault(prefix, set()).add(option)
+            self.words = {}
+            '''Maps each lower-case word or prefix to a tuple of the WordOption
+            objects it's valid for, in the same order as they were passed in.'''
+            for word, options in matches.items():
+                self.words[word] = tuple([option for option in self.wordoptions if option in options])
+            
+        def get_options(self, value):
+            '''Returns a tuple of the WordOption objects the value is valid for.'''
+            options = self.words.get(value.lower(), ())
+            if self.unindexed:
+                options = tuple([option for option in self.wordoptions if option in options or (option in self.unindexed and option.includesvalue(value))])
+            return options
+    
     
     
     # These are the various directives recognized by python.
@@ -243,6 +369,49 @@ class DSoptions(object):
         an index of numranges is None instead of a list, it indicates that no
         numeric values were encountered for the corresponding token.'''
         
+        self.rows = 0
+        '''The number of date strings that have been used to initialize and cull
+        the token possibilities.'''
+        
+        self.stablerows = 0
+        '''The number of most recent date strings in a row that were culled
+        without removing any token possibilities.'''
+        
+        self.convergedrow = None
+        '''If culling switched over to its converged mode, this is the number of
+        date strings that had been used when it did. Otherwise it's None.'''
+        
+        self.exhausted = True
+        '''False if culling stopped before the end of the input because the
+        sample budget ran out, True otherwise.'''
+        
+        self.ruleindex = None
+        '''While apply_rules is running, this is the DSRuleIndex shared by
+        all the rules being applied. Otherwise it's None.'''
+        
+        self.stats = None
+        '''A DSstats object that measurements are recorded in while
+        initializing and processing, or None to not measure anything.'''
+        
+        self.rulememo = None
+        '''The DSRuleMemo used by get_current_options, created the first
+        time it's needed.'''
+        
+        self.current = None
+        '''A processed copy of this object, made by get_current_options and
+        kept until update changes the token possibilities. Otherwise None.'''
+        
+        self.currentpenalty = None
+        '''The duplicate penalty the current copy was processed with.'''
+        
+        self.numindex = None
+        '''A NumIndex for the numeric directive options, built the first
+        time it's needed. (See get_num_index.)'''
+        
+        self.wordindex = None
+        '''A WordIndex for the alphabetical directive options, built the
+        first time it's needed. (See get_word_index.)'''
+        
         self.numoptions = numOptions
         self.wordoptions = wordOptions
         self.tzoffsetdirective = tzOffsetDirective
@@ -254,14 +423,15 @@ class DSoptions(object):
         
     # Initialize and process everything for a data set in one convenient method. Recommended you use this unless you're sure of what you're doing.
     @staticmethod
-    def detect_format(dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None):
+    def detect_format(dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None, dedupe=False, converge=False, budget=None, cache=None, columnar=False, bitset=False, memo=None, stats=None, sampler=None):
         '''Initialize and process everything for a data set in one convenient
         method. (Recommended you use this unless you're sure of what you're
         doing.)
         Returns a DSoptions object containing date format information.
         
         :param dates: A set of identically-formatted date strings for which
-            the formatting should be detected.
+            the formatting should be detected. Can be any iterable of strings,
+            including a generator; it's only iterated over once.
         :param formatRules: (optional) A set of rule objects such as those
             found in DSrule.py which inform the parser of what assumptions it
             should make regarding how input data will normally be formatted.
@@ -277,38 +447,196 @@ class DSoptions(object):
             directive to use for them. (You probably want this to be '%z'.)
             Defaults to the value returned by
             DSoptions.get_default_tzoffsetdirective().
+        :param dedupe: (optional) If True, repeated date strings and repeated
+            token values are skipped while culling. See cull_with_dates.
+            Defaults to False.
+        :param converge: (optional) If True, culling switches to a cheaper
+            mode once the token possibilities stop changing. See
+            cull_with_dates. Defaults to False.
+        :param budget: (optional) If set, stop reading date strings once this
+            many have been used. See get_convergence_report for how to tell
+            whether that was enough. Defaults to None, meaning all of them are
+            used.
+        :param cache: (optional) A DSFormatCache or DSFormatRegistry, used
+            to skip applying the rules when the same possibilities have been
+            processed before. See process. Defaults to None.
+        :param columnar: (optional) If True, cull many date strings at once
+            using the distinct values at each position. See cull_with_dates.
+            Defaults to False.
+        :param bitset: (optional) If True, cull the possibilities using a
+            DSbitset. See initialize. Defaults to False.
+        :param memo: (optional) A DSRuleMemo object, used to skip applying
+            rules whose inputs are the same as when it last saw them. See
+            apply_rules. Defaults to None.
+        :param stats: (optional) A DSstats object to record how long each
+            phase and rule took and what culling did. Defaults to None,
+            meaning nothing is measured.
+        :param sampler: (optional) A DSsampler object, used to cull only a
+            random sample of the date strings. See initialize. Defaults to
+            None, meaning all of them are culled.
         '''
         
-        # Handle default values for various options
-        formatRules = formatRules if formatRules else DSoptions.get_default_rules()
-        numOptions = numOptions if numOptions else DSoptions.get_default_numoptions()
-        wordOptions = wordOptions if wordOptions else DSoptions.get_default_wordoptions()
-        tzOffsetDirective = tzOffsetDirective if tzOffsetDirective else DSoptions.get_default_tzoffsetdirective()
-        
         # Do the format detection
-        options = DSoptions(formatRules,numOptions,wordOptions,tzOffsetDirective)
-        options.initialize(dates)
-        options.process()
+        options = DSoptions.create_with_defaults(formatRules,numOptions,wordOptions,tzOffsetDirective)
+        options.stats = stats
+        options.initialize(dates, dedupe, converge, budget, columnar, bitset, sampler)
+        options.process(cache=cache, memo=memo)
         
         # All done!
         return options
         
-    def initialize(self, dates):
+    # Like detect_format, but for data sets where not every date string is formatted the same way.
+    @staticmethod
+    def detect_formats(dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None):
+        '''Initialize and process everything for a data set that may contain
+        more than one date format.
+        Date strings are grouped by the kinds of the tokens they contain
+        (e.g. '2014-12-15' and '15 Dec 2014' have different signatures)
+        and the format is detected separately for each group, all in a
+        single pass over the input.
+        Returns a list of (DSoptions, count) tuples, one for each group,
+        where count is the number of date strings in that group. The list
+        is ordered from the most common group to the least common.
+        
+        :param dates: A set of date strings for which the formatting should
+            be detected. Can be any iterable of strings, including a
+            generator; it's only iterated over once.
+        :param formatRules: (optional) A set of rule objects. Defaults to the
+            value returned by DSoptions.get_default_rules().
+        :param numOptions: (optional) A set of NumOption objects. Defaults to
+            the value returned by DSoptions.get_default_numoptions().
+        :param wordOptions: (optional) A set of WordOption objects. Defaults
+            to the value returned by DSoptions.get_default_wordoptions().
+        :param tzOffsetDirective: (optional) The timezone offset directive.
+            Defaults to the value returned by
+            DSoptions.get_default_tzoffsetdirective().
+        '''
+        
+        # If it's just one string, turn it into a collection like the methods expect
+        if isinstance(dates, ("".__class__, u"".__class__)):
+            dates = [ dates ]
+            
+        # Sort the date strings into groups by token kind signature, seeding each group's possibilities with the first date string in it
+        groups = {}
+        ordered_groups = []
+        for date in dates:
+            date_tokens = DStoken.tokenize_date_compact(date)
+            signature = tuple([kind for kind, text in date_tokens])
+            group = groups.get(signature)
+            if group is None:
+                options = DSoptions.create_with_defaults(formatRules,numOptions,wordOptions,tzOffsetDirective)
+                options.init_with_date_tokens(date_tokens)
+                group = [options, 0]
+                groups[signature] = group
+                ordered_groups.append(group)
+            else:
+                group[0].cull_with_date_tokens(date_tokens)
+            group[1] += 1
+            
+        # Process each group
+        results = []
+        for options, count in ordered_groups:
+            options.cull_decorators()
+            options.process()
+            results.append((options, count))
+        results.sort(key=lambda result: -result[1])
+        
+        # All done!
+        return results
+        
+    @staticmethod
+    def create_with_defaults(formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None):
+        '''Constructs a DSoptions object, using the default value for any
+        of the arguments that aren't provided.
+        Returns the DSoptions object.
+        
+        :param formatRules: (optional) Defaults to the value returned by
+            DSoptions.get_default_rules().
+        :param numOptions: (optional) Defaults to the value returned by
+            DSoptions.get_default_numoptions().
+        :param wordOptions: (optional) Defaults to the value returned by
+            DSoptions.get_default_wordoptions().
+        :param tzOffsetDirective: (optional) Defaults to the value returned
+            by DSoptions.get_default_tzoffsetdirective().
+        '''
+        formatRules = formatRules if formatRules else DSoptions.get_default_rules()
+        numOptions = numOptions if numOptions else DSoptions.get_default_numoptions()
+        wordOptions = wordOptions if wordOptions else DSoptions.get_default_wordoptions()
+        tzOffsetDirective = tzOffsetDirective if tzOffsetDirective else DSoptions.get_default_tzoffsetdirective()
+        return DSoptions(formatRules,numOptions,wordOptions,tzOffsetDirective)
+        
+    def initialize(self, dates, dedupe=False, converge=False, budget=None, columnar=False, bitset=False, sampler=None):
         '''Initialize token possibility data for a set of date strings.
+        The dates are consumed one at a time: the first date string is used
+        to seed the token possibilities and the rest are used to cull them,
+        so any iterable (like a generator reading lines from a file) can be
+        passed in and memory use won't grow with the number of dates.
         
         :param dates: A set of identically-formatted date strings for which
-            the formatting should be detected.
+            the formatting should be detected. Can be a single string, a
+            list or tuple, or any other iterable of strings.
+        :param dedupe: (optional) If True, repeated date strings and repeated
+            token values are skipped while culling. See cull_with_dates.
+            Defaults to False.
+        :param converge: (optional) If True, culling switches to a cheaper
+            mode once the token possibilities stop changing. See
+            cull_with_dates. Defaults to False.
+        :param budget: (optional) If set, stop reading date strings once this
+            many have been used, counting the first one. Defaults to None,
+            meaning all of them are used.
+        :param columnar: (optional) If True, cull many date strings at once.
+            See cull_with_dates. Defaults to False.
+        :param bitset: (optional) If True, the possibilities are culled as
+            bitmasks by a DSbitset object and then written back as lists of
+            DStoken objects, with exactly the same result. This is faster
+            when there are lots of date strings. The dedupe, converge and
+            columnar options are ignored. Defaults to False.
+        :param sampler: (optional) A DSsampler object. If given, only a
+            random sample of the date strings is culled; see DSsampler. The
+            other options besides dates are ignored. Defaults to None.
+        
+        If the stats attribute is set, the time spent seeding and culling
+        and what culling removed are recorded there.
         '''
         # If it's just one string, turn it into a collection like the methods expect
         if isinstance(dates, ("".__class__, u"".__class__)):
             dates = [ dates ]
-        # Do the initializing
-        date_tokens = DStoken.tokenize_date(dates[0])
-        self.init_with_date_tokens(date_tokens)
-        self.cull_with_dates(dates)
+        stats = self.stats
+        begin = stats.clock() if stats is not None else None
+        if sampler is not None:
+            sampler.sample(self, dates)
+            if stats is not None:
+                stats.add_phase('sample', begin)
+            return
+        # Seed the possibilities using the first date string, then cull using the rest
+        engine = DSbitset(self) if bitset else None
+        dates = iter(dates)
+        first = next(dates, None)
+        if first is None:
+            if engine is not None:
+                engine.materialize()
+            return
+        date_tokens = DStoken.tokenize_date_compact(first)
+        if engine is not None:
+            engine.init_with_date_tokens(date_tokens)
+        else:
+            self.init_with_date_tokens(date_tokens)
+        if stats is not None:
+            counts = engine.get_counts() if engine is not None else [len(toklist) for toklist in self.allowed]
+            begin = stats.add_phase('init', begin)
+        if engine is not None:
+            engine.cull_with_dates(dates, budget)
+            engine.materialize()
+        else:
+            self.cull_with_dates(dates, dedupe, converge, budget, columnar)
+        if stats is not None:
+            begin = stats.add_phase('cull', begin)
         self.cull_decorators()
+        if stats is not None:
+            stats.add_phase('cull_decorators', begin)
+            stats.add_culling(self, counts)
     
-    def process(self, dupepenalty=-2):
+    def process(self, dupepenalty=-2, cache=None, memo=None):
         '''Process token possibility data for a set of date strings by
         applying rules and checking for duplicate directives.
         Each token possibility will have a score assigned to it which
@@ -320,10 +648,96 @@ class DSoptions(object):
         :param dupepenalty: (optional) How the score of duplicate token
             possibilities should be affected, as judged by
             DSoptions.penalize_duplicates().
+        :param cache: (optional) A DSFormatCache or DSFormatRegistry. If
+            the cache already holds the scores for possibilities just like
+            these, they're used instead of applying the rules again;
+            otherwise the scores are stored in the cache after processing.
+            Defaults to None, meaning no cache is used.
+        :param memo: (optional) A DSRuleMemo object, used to skip applying
+            rules whose inputs haven't changed since it last saw them. See
+            apply_rules. Defaults to None.
+        
+        If the stats attribute is set, the time spent in each step is
+        recorded there, along with the time each rule takes. (See
+        apply_rules.)
         '''
-        self.apply_rules(self.formatrules)
+        stats = self.stats
+        begin = stats.clock() if stats is not None else None
+        if cache is not None:
+            found = cache.lookup(self, dupepenalty)
+            if stats is not None:
+                begin = stats.add_phase('cache_lookup', begin)
+            if found:
+                return
+        self.apply_rules(self.formatrules, memo)
+        if stats is not None:
+            begin = stats.add_phase('apply_rules', begin)
         if dupepenalty:
             self.penalize_duplicates(dupepenalty)
+            if stats is not None:
+                begin = stats.add_phase('penalize_duplicates', begin)
+        if cache is not None:
+            cache.store(self, dupepenalty)
+            if stats is not None:
+                stats.add_phase('cache_store', begin)
+        
+    def update(self, date_string):
+        '''Use one more date string to initialize or cull the token
+        possibilities, for detecting the format of a stream of date strings
+        as they arrive. The first date string seeds the possibilities and
+        the rest cull them, the same as initialize. Call current_format or
+        get_current_options at any time for the best guess so far.
+        Returns True if the date string changed the possibilities or the
+        range of numbers seen somewhere, False otherwise.
+        
+        :param date_string: The date string.
+        '''
+        date_tokens = DStoken.tokenize_date_compact(date_string)
+        if not self.rows:
+            self.init_with_date_tokens(date_tokens)
+            self.current = None
+            return True
+        # Remember the ranges of numbers seen to check whether they get widened
+        before = [tuple(numrange) for numrange in self.numranges if numrange]
+        changed = self.cull_with_date_tokens(date_tokens) > 0
+        changed = changed or before != [tuple(numrange) for numrange in self.numranges if numrange]
+        if changed:
+            self.current = None
+        return changed
+        
+    def get_current_options(self, dupepenalty=-2, cache=None):
+        '''Returns a processed copy of this object, for the best guess at the
+        format given the date strings used so far. This object is left as it
+        is, so more date strings can be added with update afterward. The
+        copy is kept and returned again until update changes something or
+        a different duplicate penalty is asked for, so calling this often is
+        cheap. And when something has changed, rules
+        whose inputs are the same as last time aren't applied again. (See
+        DSRuleMemo.)
+        
+        :param dupepenalty: (optional) See process.
+        :param cache: (optional) See process.
+        '''
+        if self.current is None or self.currentpenalty != dupepenalty:
+            current = DSoptions(self.formatrules, self.numoptions, self.wordoptions, self.tzoffsetdirective)
+            current.allowed = [[DStoken(tok.kind, tok.text, tok.option) for tok in toklist] for toklist in self.allowed]
+            current.numranges = [list(numrange) if numrange else None for numrange in self.numranges]
+            current.rows = self.rows
+            current.stablerows = self.stablerows
+            current.exhausted = self.exhausted
+            current.stats = self.stats
+            current.cull_decorators()
+            if self.rulememo is None:
+                self.rulememo = DSRuleMemo()
+            current.process(dupepenalty, cache, self.rulememo)
+            self.current = current
+            self.currentpenalty = dupepenalty
+        return self.current
+        
+    def current_format(self):
+        '''Returns the format string for the date strings used so far. See
+        get_current_options.'''
+        return self.get_current_options().get_format_string()
         
     def get_format_tokens(self):
         '''Returns a list of the parser's current best guess for what matches each date token.'''
@@ -333,6 +747,77 @@ class DSoptions(object):
             if maxtok:
                 tokens.append(maxtok)
         return tokens
+        
+    def get_parser(self):
+        '''Returns a DSparser object for parsing date strings with the
+        format determined by the parser, or None if the format wasn't
+        recognized, in the same cases get_format_string returns a blank
+        string.'''
+        if not self.get_format_string():
+            return None
+        return DSparser(self.get_format_tokens())
+        
+    def get_recognized_parser(self):
+        '''Used by parse_all and parse_all_array to get a DSparser object.
+        Raises a ValueError if the format wasn't recognized.'''
+        parser = self.get_parser()
+        if parser is None:
+            raise ValueError("Can't parse date strings, the format wasn't recognized")
+        return parser
+        
+    def parse_all(self, dates, epoch=False):
+        '''Parse many date strings with the format determined by the parser.
+        This is much faster than calling datetime.strptime for each one with
+        the format string. See DSparser.parse_all.
+        Returns a list with a datetime object for each date string, or the
+        number of seconds since the unix epoch for each if epoch is True.
+        
+        :param dates: An iterable of date strings.
+        :param epoch: (optional) If True, return integer seconds since
+            1970-01-01 00:00:00 instead of datetime objects. Date strings
+            without a timezone offset are taken to be in UTC. Defaults to
+            False.
+        Raises a ValueError if the format wasn't recognized.
+        '''
+        return self.get_recognized_parser().parse_all(dates, epoch)
+        
+    def parse_all_array(self, dates, epoch=False):
+        '''Parse many date strings with the format determined by the parser
+        into a NumPy datetime64[s] array, or an int64 array of seconds since
+        the unix epoch if epoch is True. Requires NumPy. Fixed-width numeric
+        formats like '%Y-%m-%d %H:%M:%S' are read for all the date strings
+        at once. See DSparser.parse_all_array.
+        
+        :param dates: An iterable of date strings.
+        :param epoch: (optional) If True, return seconds since the unix epoch
+            instead of datetime64 values. Defaults to False.
+        Raises a ValueError if the format wasn't recognized.
+        '''
+        return self.get_recognized_parser().parse_all_array(dates, epoch)
+        
+    def get_convergence_report(self):
+        '''Returns a dict describing how settled the token possibilities are.
+        It contains the number of date strings used ('rows'), how many of the
+        most recent ones in a row removed no possibilities ('stable_rows'),
+        the number of date strings used when culling switched to its
+        converged mode or None if it didn't ('converged_at'), whether all of
+        the input was used ('exhausted') and an estimate of the probability
+        that the possibilities wouldn't change given more input
+        ('confidence'). If all of the input was used the confidence is 1.0,
+        otherwise it's estimated from the stable rows by the rule of
+        succession.
+        '''
+        if self.exhausted:
+            confidence = 1.0
+        else:
+            confidence = 1.0 - 1.0 / (self.stablerows + 2)
+        return {
+            'rows': self.rows,
+            'stable_rows': self.stablerows,
+            'converged_at': self.convergedrow,
+            'exhausted': self.exhausted,
+            'confidence': confidence
+        }
     
     
     
@@ -351,52 +836,110 @@ class DSoptions(object):
         a possible value for each NumOption and WordOption.
         
         :param date_tokens: A list of DStoken objects returned by the
-            DStoken.tokenize_date() method, where the method's argument
-            is a date string.
+            DStoken.tokenize_date() method, or of (kind, text) tuples
+            returned by the DStoken.tokenize_date_compact() method, where
+            the method's argument is a date string.
         '''
+        date_tokens = DStoken.get_kinds_and_texts(date_tokens)
         toklist_count = len(date_tokens)
         skip = False
         for i in range(0,toklist_count):
             if skip:
                 skip = False
             else:
-                tok = date_tokens[i]
+                kind, text = date_tokens[i]
                 numrange = None
                 # Add the token as a potential decorator
-                allowhere = [DStoken.create_decorator(tok.text)]
+                allowhere = [DStoken.create_decorator(text)]
                 # Token is a number
-                if tok.is_number():
-                    number = int(tok.text)
-                    for option in self.numoptions:
-                        if option.includesvalue(number):
-                            allowhere.append(DStoken.create_number(option))
-                            numrange = [number,number]
+                if kind == DStoken.KIND_NUMBER:
+                    number = int(text)
+                    for option in self.get_num_index().get_options(number):
+                        allowhere.append(DStoken.create_number(option))
+                        numrange = [number,number]
                 # Token is a word
-                elif tok.is_word():
-                    for option in self.wordoptions:
-                        if option.includesvalue(tok.text):
-                            allowhere.append(DStoken.create_word(option))
+                elif kind == DStoken.KIND_WORD:
+                    for option in self.get_word_index().get_options(text):
+                        allowhere.append(DStoken.create_word(option))
                 # Token is a timezone
-                if tok.is_timezone():
+                if kind == DStoken.KIND_TIMEZONE:
                     allowhere.append(DStoken.create_timezone(self.tzoffsetdirective))
                 # Add the list of possibilities for this token to the overall list
                 self.allowed.append(allowhere)
                 self.numranges.append(numrange)
+        self.rows += 1
             
-    def cull_with_dates(self, dates):
+    def cull_with_dates(self, dates, dedupe=False, converge=False, budget=None, columnar=False):
         '''Cull token possibility data using a set of date strings. The
         values for each token in the date strings are checked against the
         possibilities for that position and if a value is found to lie
         outside the possible values for a directive, that directive is
         discarded as a possibility for the location.
+        Culling a position with a value it's already been culled with never
+        changes anything, so with dedupe enabled date strings that were
+        already seen are skipped entirely, and so are the individual token
+        values that were already seen at each position. That way the work
+        done scales with the number of distinct values rather than the
+        number of date strings. At most DEDUPE_CACHE_SIZE values are
+        remembered for each position and for whole date strings; values
+        past that are just culled as usual.
+        Once CONVERGENCE_ROWS date strings in a row have been culled without
+        removing anything, the possibilities usually won't change again. With
+        converge enabled, positions where only numeric directives remain are
+        then just checked against the range of values already seen there:
+        since every remaining directive accepts that whole range, only values
+        outside of it need to be checked against each directive. Positions
+        with a directive that NumIndex can't tell accepts a whole range of
+        numbers, like one of a NumOption subclass, are always culled as
+        usual. The result is exactly the same as regular culling.
         
-        :param dates: A set of identically-formatted date strings.
+        :param dates: A set of identically-formatted date strings. Can be any
+            iterable of strings; they're tokenized and culled one at a time.
+        :param dedupe: (optional) If True, skip date strings and token values
+            that were already seen. Defaults to False.
+        :param converge: (optional) If True, switch to the converged mode
+            described above once the possibilities are stable. Defaults to
+            False.
+        :param budget: (optional) If set, stop once the total number of date
+            strings used (as tracked by the rows attribute) reaches this many,
+            and set the exhausted attribute to False if there were any left.
+            Defaults to None, meaning there's no limit.
+        :param columnar: (optional) If True, cull COLUMN_CHUNK_SIZE date
+            strings at a time using cull_with_column. This is much faster
+            when the date strings all have the same layout, and makes dedupe
+            and converge unnecessary, so they're ignored. Defaults to False.
         '''
+        if columnar:
+            self.cull_with_columns(dates, budget)
+            return
+        seen_dates = set() if dedupe else None
+        seen_values = [set() for toklist in self.allowed] if dedupe else None
+        numeric_positions = None
+        dates = iter(dates)
         for date in dates:
-            date_tokens = DStoken.tokenize_date(date)
-            self.cull_with_date_tokens(date_tokens)
+            # Stop here if the sample budget ran out
+            if budget is not None and self.rows >= budget:
+                self.exhausted = False
+                break
+            # Skip date strings that were already seen
+            if seen_dates is not None:
+                if date in seen_dates:
+                    self.rows += 1
+                    self.stablerows += 1
+                    continue
+                if len(seen_dates) < DSoptions.DEDUPE_CACHE_SIZE:
+                    seen_dates.add(date)
+            date_tokens = DStoken.tokenize_date_compact(date)
+            self.cull_with_date_tokens(date_tokens, seen_values, numeric_positions)
+            # Switch to converged mode once the possibilities are stable
+            if converge and numeric_positions is None and self.stablerows >= DSoptions.CONVERGENCE_ROWS:
+                numindex = self.get_num_index()
+                numeric_positions = [
+                    bool(toklist) and all(tok.kind == DStoken.KIND_NUMBER and numindex.isinterval(tok.option) for tok in toklist) for toklist in self.allowed
+                ]
+                self.convergedrow = self.rows
         
-    def cull_with_date_tokens(self, date_tokens):
+    def cull_with_date_tokens(self, date_tokens, seen_values=None, numeric_positions=None):
         '''Cull token possibility data using a single tokenized date. The
         value for each token in the tokenized date string os checked against
         the possibilities for that position and if a value is found to lie
@@ -404,35 +947,217 @@ class DSoptions(object):
         discarded as a possibility for the location.
         
         :param date_tokens: A list of DStoken objects returned by the
-            DStoken.tokenize_date() method, where the method's argument
-            is a date string.
+            DStoken.tokenize_date() method, or of (kind, text) tuples
+            returned by the DStoken.tokenize_date_compact() method, where
+            the method's argument is a date string.
+        :param seen_values: (optional) A list containing a set for each
+            position, used to remember the (kind, text) value signatures that
+            position was already culled with. Positions where the value was
+            already seen are skipped. Defaults to None, meaning every
+            position is always culled.
+        :param numeric_positions: (optional) A list containing a boolean for
+            each position, True where only numeric directives that accept a
+            whole range of numbers (see NumIndex.isinterval) remain. Numbers
+            at those positions that lie within the range already recorded in
+            numranges are skipped. Defaults to None, meaning every position
+            is always culled.
+        Returns the number of token possibilities that were removed.
         '''
+        date_tokens = DStoken.get_kinds_and_texts(date_tokens)
+        wordindex = self.get_word_index()
+        numindex = self.get_num_index()
+        bits = numindex.bits
+        removed = 0
         itrrange = min(len(self.allowed),len(date_tokens))
         for i in range(0,itrrange):
-            for j in range(len(self.allowed[i])-1,-1,-1): # iterate backwards so we can remove elements without hiccuping
-                tok = self.allowed[i][j]
+            kind, text = date_tokens[i]
+            if seen_values is not None:
+                if date_tokens[i] in seen_values[i]:
+                    continue
+                if len(seen_values[i]) < DSoptions.DEDUPE_CACHE_SIZE:
+                    seen_values[i].add(date_tokens[i])
+            number = int(text) if kind == DStoken.KIND_NUMBER else None
+            words = wordindex.get_options(text) if kind == DStoken.KIND_WORD else None
+            numrange = self.numranges[i]
+            if numeric_positions is not None and numeric_positions[i] and number is not None:
+                if number >= numrange[0] and number <= numrange[1]:
+                    continue
+            toklist = self.allowed[i]
+            toklist_count = len(toklist)
+            # Look up which numeric directives accept the number all at once
+            mask = numindex.get_mask(number) if number is not None else 0
+            fits = False
+            for j in range(toklist_count-1,-1,-1): # iterate backwards so we can remove elements without hiccuping
+                tok = toklist[j]
                 # if it's not a directive, just check for equivalency
-                if tok.is_decorator():
-                    if tok.text != date_tokens[i].text:
-                        del self.allowed[i][j]
+                if tok.kind == DStoken.KIND_DECORATOR:
+                    if tok.text != text:
+                        del toklist[j]
                 # if it is a directive, verify it's the same kind (number/word/timezone)
-                elif tok.kind != date_tokens[i].kind:
-                    del self.allowed[i][j]
+                elif tok.kind != kind:
+                    del toklist[j]
                 # if it is a directive and it's the right kind, make sure the data fits
                 else:
                     # if it's a number, check that this is in the correct range
-                    if date_tokens[i].is_number():
-                        number = int(date_tokens[i].text)
-                        if tok.option.includesvalue(number):
-                            self.numranges[i][0] = min(number,self.numranges[i][0])
-                            self.numranges[i][1] = max(number,self.numranges[i][1])
+                    if kind == DStoken.KIND_NUMBER:
+                        bit = bits.get(tok.option)
+                        if (bit & mask) if bit is not None else tok.option.includesvalue(number):
+                            fits = True
                         else:
-                            del self.allowed[i][j]
+                            del toklist[j]
                     # if it's a word, check that it meets the same requirements
-                    elif date_tokens[i].is_word():
-                        if not tok.option.includesvalue(date_tokens[i].text):
-                            del self.allowed[i][j]
+                    elif kind == DStoken.KIND_WORD:
+                        if tok.option not in words:
+                            del toklist[j]
+            # Widen the range of numbers seen here if any numeric directive accepted this one
+            if fits:
+                numrange[0] = min(number,numrange[0])
+                numrange[1] = max(number,numrange[1])
+            removed += toklist_count - len(toklist)
+        # Keep track of how many date strings in a row haven't changed anything
+        self.rows += 1
+        if removed:
+            self.stablerows = 0
+        else:
+            self.stablerows += 1
+        return removed
                             
+    def cull_with_columns(self, dates, budget=None):
+        '''Cull token possibility data using a set of date strings, taking
+        COLUMN_CHUNK_SIZE of them at a time and culling each chunk with
+        cull_with_column. Used by cull_with_dates when columnar culling is
+        enabled.
+        
+        :param dates: A set of identically-formatted date strings. Can be any
+            iterable of strings.
+        :param budget: (optional) See cull_with_dates.
+        '''
+        dates = iter(dates)
+        while True:
+            size = DSoptions.COLUMN_CHUNK_SIZE
+            # Stop here if the sample budget ran out
+            if budget is not None:
+                if self.rows >= budget:
+                    for date in dates:
+                        self.exhausted = False
+                        break
+                    break
+                size = min(size, budget - self.rows)
+            chunk = list(itertools.islice(dates, size))
+            if not chunk:
+                break
+            self.cull_with_column(chunk)
+        
+    def cull_with_column(self, dates):
+        '''Cull token possibility data using many date strings at once. If
+        the date strings all have tokens of the same kinds in the same
+        order, which is typical of a column of identically-formatted dates,
+        each position is culled just once using the distinct values found
+        there: decorators survive if there's only one value and it matches,
+        numeric directives survive if they accept the lowest and highest
+        values (or every distinct value, for ones NumIndex can't tell accept
+        a whole range of numbers), and alphabetical directives survive if they accept every
+        distinct word. Otherwise, or if culling this way would remove every
+        numeric directive from a position (in which case how numranges gets
+        updated depends on the order of the date strings), each date string
+        is culled one at a time with cull_with_date_tokens instead. Either
+        way the possibilities and numranges end up exactly the same.
+        Since the date strings aren't culled in order, if any possibilities
+        are removed then the stablerows attribute is reset to zero at the
+        end rather than counting the date strings after the last one that
+        removed something.
+        Returns the number of token possibilities that were removed.
+        
+        :param dates: A list of date strings.
+        '''
+        split = [DStoken.split_date(date) for date in dates]
+        if not split:
+            return 0
+        kinds = split[0][0]
+        wordindex = self.get_word_index()
+        numindex = self.get_num_index()
+        removed = 0
+        plan = []
+        
+        # Work out what survives at each position, as long as all the layouts are the same
+        if all(row[0] == kinds for row in split):
+            columns = list(zip(*[row[1] for row in split]))
+            for i in range(0,min(len(self.allowed),len(kinds))):
+                kind = kinds[i]
+                values = set(columns[i])
+                if kind == DStoken.KIND_NUMBER:
+                    numbers = [int(text) for text in values]
+                    low = min(numbers)
+                    high = max(numbers)
+                    mask = numindex.get_mask(low) & numindex.get_mask(high)
+                toklist = self.allowed[i]
+                allowhere = []
+                for tok in toklist:
+                    if tok.kind == DStoken.KIND_DECORATOR:
+                        keep = len(values) == 1 and tok.text in values
+                    elif tok.kind != kind:
+                        keep = False
+                    elif kind == DStoken.KIND_NUMBER:
+                        if numindex.isinterval(tok.option):
+                            keep = numindex.includesvalue(tok.option, low, mask) and numindex.includesvalue(tok.option, high, mask)
+                        else:
+                            keep = all(tok.option.includesvalue(number) for number in numbers)
+                    elif kind == DStoken.KIND_WORD:
+                        keep = all(tok.option in wordindex.get_options(text) for text in values)
+                    else:
+                        keep = True
+                    if keep:
+                        allowhere.append(tok)
+                # Give up if every numeric directive would be removed
+                if kind == DStoken.KIND_NUMBER and self.numranges[i] is not None:
+                    if any(tok.kind == DStoken.KIND_NUMBER for tok in toklist) and not any(tok.kind == DStoken.KIND_NUMBER for tok in allowhere):
+                        plan = None
+                        break
+                plan.append((allowhere, kind == DStoken.KIND_NUMBER and (low, high)))
+        else:
+            plan = None
+            
+        # Cull one date string at a time if that's the only way to get the same result
+        if plan is None:
+            for kinds, texts in split:
+                removed += self.cull_with_date_tokens(list(zip(kinds, texts)))
+            return removed
+            
+        # Otherwise update everything at once
+        for i in range(0,len(plan)):
+            allowhere, numbers = plan[i]
+            toklist = self.allowed[i]
+            removed += len(toklist) - len(allowhere)
+            toklist[:] = allowhere
+            numrange = self.numranges[i]
+            if numbers and numrange is not None and any(tok.kind == DStoken.KIND_NUMBER for tok in allowhere):
+                numrange[0] = min(numbers[0],numrange[0])
+                numrange[1] = max(numbers[1],numrange[1])
+        self.rows += len(split)
+        if removed:
+            self.stablerows = 0
+        else:
+            self.stablerows += len(split)
+        return removed
+        
+    def get_num_index(self):
+        '''Returns a NumIndex for the numeric directive options. It's built
+        the first time this is called and reused after that, so if the
+        numoptions attribute is changed then the numindex attribute should
+        be set to None.'''
+        if self.numindex is None:
+            self.numindex = DSoptions.NumIndex(self.numoptions)
+        return self.numindex
+        
+    def get_word_index(self):
+        '''Returns a WordIndex for the alphabetical directive options. It's
+        built the first time this is called and reused after that, so if
+        the wordoptions attribute is changed then the wordindex attribute
+        should be set to None.'''
+        if self.wordindex is None:
+            self.wordindex = DSoptions.WordIndex(self.wordoptions)
+        return self.wordindex
+        
     def cull_decorators(self):
         '''Remove non-directive token possibilities where any directive
         possibilities remain at that position.'''
@@ -454,7 +1179,7 @@ class DSoptions(object):
                     if tok.is_decorator():
                         del self.allowed[i][j]
             
-    def apply_rules(self, rules):
+    def apply_rules(self, rules, memo=None):
         '''Apply all rules in a set to token possibility data.
         Scores for token possibilities will be affected according to the
         assumptions the parser is instructed to make based on the rules
@@ -470,11 +1195,44 @@ class DSoptions(object):
         which directive to act in favor of by which has the highest-scoring
         instance.
         
+        The possibilities at each position are indexed by their text once,
+        before any rules are applied, and the rules use that index to find
+        the possibilities they affect. (See get_rule_index.)
+        
         :param rules: A set of rule objects, like DSPatternRule or
             DSMutExclusionRule.
+        :param memo: (optional) A DSRuleMemo object. Rules whose inputs are
+            the same as when the memo last saw them aren't applied again;
+            the changes they made to scores then are just repeated instead.
+            Defaults to None, meaning every rule is applied.
+        
+        If the stats attribute is set, the time each rule takes and the
+        changes it makes to scores are recorded there.
         '''
-        for rule in rules:
-            rule.apply(self)
+        stats = self.stats
+        inputids = memo.start(self) if memo is not None else None
+        self.ruleindex = DSRuleIndex(self.allowed)
+        try:
+            for index, rule in enumerate(rules):
+                if stats is not None:
+                    before = self.get_scores()
+                    begin = stats.clock()
+                if memo is not None:
+                    memo.apply(rule, self, inputids)
+                else:
+                    rule.apply(self)
+                if stats is not None:
+                    stats.add_rule(index, rule, stats.clock() - begin, before, self.get_scores())
+        finally:
+            self.ruleindex = None
+            
+    def get_rule_index(self):
+        '''Returns a DSRuleIndex for the current token possibilities. While
+        apply_rules is running the same index is returned every time;
+        otherwise a new one is built.'''
+        if self.ruleindex is not None:
+            return self.ruleindex
+        return DSRuleIndex(self.allowed)
 
     # This solution isn't perfect but if there are indeed duplicates then the
     # root of the problem probably lies with the rules being used, that they
@@ -533,6 +1291,156 @@ class DSoptions(object):
     
     
     
+    # These methods are for splitting the culling work up, e.g. across several workers each culling a shard of a data set
+    # get_state returns a compact description of the culled possibilities that can be pickled or converted to JSON, and from_state turns it back into a DSoptions object
+    # merge combines the culled possibilities from two DSoptions objects, and the result can be processed just as if all the data had been culled by one object
+    
+    def get_fingerprint(self):
+        '''Returns a tuple that identifies the culled token possibility data:
+        the kind and text of each possibility at each position, and the
+        ranges in numranges. The result of processing depends only on this
+        and on the parser options, so it can be used as a cache key.
+        '''
+        return (
+            tuple([tuple([(tok.kind, tok.text) for tok in toklist]) for toklist in self.allowed]),
+            tuple([tuple(numrange) if numrange else None for numrange in self.numranges])
+        )
+        
+    def get_scores(self):
+        '''Returns the scores of the token possibilities as a tuple of tuples,
+        one for each position, in the same order as the allowed attribute.'''
+        return tuple([tuple([tok.score for tok in toklist]) for toklist in self.allowed])
+        
+    def set_scores(self, scores):
+        '''Set the scores of the token possibilities.
+        
+        :param scores: A tuple of tuples as returned by get_scores, for
+            possibilities with the same fingerprint as these.
+        '''
+        for toklist, toklist_scores in zip(self.allowed, scores):
+            for tok, score in zip(toklist, toklist_scores):
+                tok.score = score
+        
+    def get_state(self):
+        '''Returns the culled token possibility data as a dict made up of
+        only lists, strings and numbers, suitable for pickling or converting
+        to JSON. Scores aren't included, so this is meant to be called after
+        initializing but before processing.
+        The 'allowed' item contains a list for each position of [kind, text]
+        pairs, one for each possibility there, and the 'numranges' item is
+        the same as the numranges attribute.
+        '''
+        return {
+            'allowed': [[[tok.kind, tok.text] for tok in toklist] for toklist in self.allowed],
+            'numranges': [list(numrange) if numrange else None for numrange in self.numranges],
+            'rows': self.rows,
+            'stablerows': self.stablerows,
+            'exhausted': self.exhausted
+        }
+        
+    def set_state(self, state):
+        '''Replace the token possibility data with what's described by a dict
+        returned by get_state. Numeric and alphabetical possibilities are
+        matched up with this object's NumOption and WordOption objects by
+        their directive strings, so this object should be using the same
+        parser options as the one the state came from.
+        Raises a ValueError if the state refers to a directive there's no
+        option for.
+        
+        :param state: A dict returned by get_state.
+        '''
+        options = {}
+        for option in self.numoptions:
+            options[(DStoken.KIND_NUMBER, option.directive)] = option
+        for option in self.wordoptions:
+            options[(DStoken.KIND_WORD, option.directive)] = option
+        self.allowed = []
+        for toklist in state['allowed']:
+            allowhere = []
+            for kind, text in toklist:
+                if kind == DStoken.KIND_DECORATOR:
+                    allowhere.append(DStoken.create_decorator(text))
+                elif kind == DStoken.KIND_TIMEZONE:
+                    allowhere.append(DStoken.create_timezone(text))
+                elif (kind, text) in options:
+                    allowhere.append(DStoken(kind, text, options[(kind, text)]))
+                else:
+                    raise ValueError("No option for directive '" + text + "'")
+            self.allowed.append(allowhere)
+        self.numranges = [list(numrange) if numrange else None for numrange in state['numranges']]
+        self.rows = state['rows']
+        self.stablerows = state['stablerows']
+        self.exhausted = state['exhausted']
+        
+    @staticmethod
+    def from_state(state, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None):
+        '''Constructs a DSoptions object from a dict returned by get_state.
+        Returns the DSoptions object.
+        
+        :param state: A dict returned by get_state.
+        :param formatRules: (optional) See detect_format.
+        :param numOptions: (optional) See detect_format.
+        :param wordOptions: (optional) See detect_format.
+        :param tzOffsetDirective: (optional) See detect_format.
+        '''
+        options = DSoptions.create_with_defaults(formatRules, numOptions, wordOptions, tzOffsetDirective)
+        options.set_state(state)
+        return options
+        
+    @staticmethod
+    def merge(first, second):
+        '''Combine the culled token possibility data of two DSoptions objects
+        that were each initialized with a different part of the same data
+        set. Possibilities survive at each position only if they survived
+        in both, and the ranges in numranges are widened to cover both.
+        As long as the second object's first date string has at least as
+        many tokens as the first object's, the possibilities are exactly the
+        same as initializing one object with all of the data would have
+        given, and so is the format after processing. The only difference
+        can be in numranges at positions where no numeric directives
+        survived, where the range depends on the order of the date strings.
+        If the second object's first date string has fewer tokens, positions
+        past its end are left as they were in the first object, while one
+        object would have culled them with the later date strings of the
+        second part that do have tokens there, so the result can keep
+        possibilities that it wouldn't have.
+        Returns a new DSoptions object, which uses the first object's parser
+        options. Neither of the arguments are changed.
+        
+        :param first: A DSoptions object that's been initialized but not
+            processed.
+        :param second: Another DSoptions object that's been initialized but
+            not processed, with the same parser options.
+        '''
+        merged = DSoptions(first.formatrules, first.numoptions, first.wordoptions, first.tzoffsetdirective)
+        if not second.rows:
+            second = first
+        elif not first.rows:
+            first = second
+        # Keep possibilities from the first object that are also present in the second
+        for i in range(0,len(first.allowed)):
+            if i < len(second.allowed) and first is not second:
+                present = set([(tok.kind, tok.text) for tok in second.allowed[i]])
+                toklist = [tok for tok in first.allowed[i] if (tok.kind, tok.text) in present]
+                # A position only has a range if the first date string had a number there
+                numranges = [numrange for numrange in (first.numranges[i], second.numranges[i]) if numrange] if first.numranges[i] else []
+            else:
+                toklist = first.allowed[i]
+                numranges = [numrange for numrange in (first.numranges[i],) if numrange]
+            merged.allowed.append([DStoken(tok.kind, tok.text, tok.option) for tok in toklist])
+            # Widen the numeric range to cover both
+            if numranges:
+                merged.numranges.append([min([numrange[0] for numrange in numranges]), max([numrange[1] for numrange in numranges])])
+            else:
+                merged.numranges.append(None)
+        merged.rows = first.rows + second.rows if first is not second else first.rows
+        merged.stablerows = min(first.stablerows, second.stablerows)
+        merged.exhausted = first.exhausted and second.exhausted
+        merged.cull_decorators()
+        return merged
+    
+    
+    
     # These are methods for returning various string representations of this object
     
     def get_format_string(self, replace_percent=True, blank_if_unrecognized=True):
@@ -0,0 +1,339 @@
+'''Contains DSparser class for DateSense package.'''
+
+
+
+import calendar
+from datetime import datetime, timedelta
+import re
+
+try:
+    from datetime import timezone
+except ImportError:
+    timezone = None # Python 2 has no fixed-offset tzinfo class, so '%z' goes through strptime there
+
+
+
+class DSparser(object):
+    '''A DSparser object parses many date strings that all share a known
+    format, much faster than calling datetime.strptime for each of them.
+    It's built from the format tokens of a DSoptions object that has
+    already been processed (see DSoptions.get_format_tokens) and compiles
+    a single regular expression with one group per directive, whose
+    values are converted directly into datetime fields.
+    Only the directives listed in DSparser.PATTERNS are handled this way.
+    If the format has any other directive, or the same directive more than
+    once, every date string is parsed with datetime.strptime instead. Any
+    date string that doesn't match the compiled expression, or whose
+    values don't make a valid date, is also handed to datetime.strptime,
+    so the results and errors are always the same as using it directly.
+    '''
+
+    # Regular expressions for the directives the fast path handles, same as the ones used by strptime
+    PATTERNS = {
+        '%Y': r'(\d\d\d\d)',
+        '%y': r'(\d\d)',
+        '%m': r'(1[0-2]|0[1-9]|[1-9])',
+        '%d': r'(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])',
+        '%H': r'(2[0-3]|[0-1]\d|\d)',
+        '%I': r'(1[0-2]|0[1-9]|[1-9])',
+        '%M': r'([0-5]\d|\d)',
+        '%S': r'(6[0-1]|[0-5]\d|\d)',
+        '%p': r'(am|pm)',
+        '%z': r'([+-]\d\d[0-5]\d)',
+        '%b': None, # Month and weekday names are filled in by get_word_pattern
+        '%B': None,
+        '%a': None,
+        '%A': None
+    }
+
+    # Ordinal of the first day of the unix epoch, used when returning epoch seconds
+    EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+    # Widths of the directives parse_all_array can read straight out of a fixed-width byte array
+    ARRAY_WIDTHS = {'%Y': 4, '%y': 2, '%m': 2, '%d': 2, '%H': 2, '%M': 2, '%S': 2, '%z': 5}
+
+
+
+    def __init__(self, format_tokens):
+        '''Constructs a DSparser object.
+        Returns the DSparser object.
+
+        :param format_tokens: A list of DStoken objects, one for each token
+            in the date format, like the list returned by
+            DSoptions.get_format_tokens.
+        '''
+        self.format_string = ''
+        '''The strptime format string for the tokens.'''
+        self.pattern = None
+        '''The compiled regular expression, or None if the format can't be parsed without strptime.'''
+        self.fields = {}
+        '''Maps each directive in the format to the index of its group in the regular expression.'''
+        self.tzinfos = {}
+
+        # Build the format string and the regular expression at the same time
+        regex = ''
+        for tok in format_tokens:
+            if tok.is_decorator():
+                self.format_string += tok.text.replace('%','%%')
+                if regex is not None:
+                    regex += re.sub(r'(\\\s)+', r'\\s+', re.escape(tok.text)) # strptime lets any whitespace in the format match any amount of whitespace
+            else:
+                self.format_string += tok.text
+                if regex is None:
+                    continue
+                if tok.text not in DSparser.PATTERNS or tok.text in self.fields or (tok.is_timezone() and timezone is None):
+                    regex = None
+                    continue
+                self.fields[tok.text] = len(self.fields)
+                regex += DSparser.PATTERNS[tok.text] or DSparser.get_word_pattern(tok.text)
+        if regex is not None and self.fields:
+            self.pattern = re.compile(regex + r'\Z', re.IGNORECASE)
+
+        # Look up month names by their lower-case text
+        self.months = {}
+        if '%b' in self.fields:
+            self.months = dict([(name.lower(), i) for i, name in enumerate(calendar.month_abbr) if name])
+        elif '%B' in self.fields:
+            self.months = dict([(name.lower(), i) for i, name in enumerate(calendar.month_name) if name])
+
+    @staticmethod
+    def get_word_pattern(directive):
+        '''Returns a regular expression group matching the month or weekday
+        names for '%b', '%B', '%a' or '%A' in the current locale.'''
+        names = {'%b': calendar.month_abbr, '%B': calendar.month_name, '%a': calendar.day_abbr, '%A': calendar.day_name}[directive]
+        names = sorted([re.escape(name) for name in names if name], key=len, reverse=True)
+        return '(' + '|'.join(names) + ')'
+
+
+
+    def parse(self, date_string):
+        '''Parse a single date string.
+        Returns a datetime object.
+        Raises a ValueError if the date string doesn't match the format,
+        same as datetime.strptime.
+
+        :param date_string: The date string to be parsed.
+        '''
+        return self.parse_all((date_string,))[0]
+
+    def parse_all(self, dates, epoch=False):
+        '''Parse many date strings.
+        Returns a list with a datetime object for each date string, or the
+        number of seconds since the unix epoch for each if epoch is True.
+        Raises a ValueError if any date string doesn't match the format,
+        same as datetime.strptime.
+
+        :param dates: An iterable of date strings.
+        :param epoch: (optional) If True, return integer seconds since
+            1970-01-01 00:00:00 instead of datetime objects. Date strings
+            without a timezone offset are taken to be in UTC. Defaults to
+            False.
+        '''
+
+        # Just use strptime if there's no compiled expression
+        if self.pattern is None:
+            strptime = datetime.strptime
+            format_string = self.format_string
+            results = [strptime(date, format_string) for date in dates]
+            if epoch:
+                results = [DSparser.get_epoch(result) for result in results]
+            return results
+
+        # Find the group for each field, or None if it's not in the format
+        fields = self.fields
+        year = fields.get('%Y')
+        shortyear = fields.get('%y')
+        month = fields.get('%m')
+        monthname = fields.get('%b', fields.get('%B'))
+        day = fields.get('%d')
+        hour = fields.get('%H')
+        shorthour = fields.get('%I')
+        ampm = fields.get('%p')
+        minute = fields.get('%M')
+        second = fields.get('%S')
+        offset = fields.get('%z')
+
+        # Parse each date string
+        match = self.pattern.match
+        months = self.months
+        results = []
+        for date in dates:
+            found = match(date)
+            if found is None:
+                results.append(self.parse_with_strptime(date, epoch))
+                continue
+            groups = found.groups()
+            try:
+                # Year, month and day default to 1900-01-01 the same as with strptime
+                if year is not None:
+                    y = int(groups[year])
+                elif shortyear is not None:
+                    y = int(groups[shortyear])
+                    y += 2000 if y <= 68 else 1900
+                else:
+                    y = 1900
+                if month is not None:
+                    mo = int(groups[month])
+                elif monthname is not None:
+                    mo = months[groups[monthname].lower()]
+                else:
+                    mo = 1
+                d = int(groups[day]) if day is not None else 1
+                # 12-hour times without AM/PM are taken to be AM
+                if hour is not None:
+                    h = int(groups[hour])
+                elif shorthour is not None:
+                    h = int(groups[shorthour]) % 12
+                    if ampm is not None and groups[ampm].lower() == 'pm':
+                        h += 12
+                else:
+                    h = 0
+                mi = int(groups[minute]) if minute is not None else 0
+                s = int(groups[second]) if second is not None else 0
+                tzinfo = self.get_tzinfo(groups[offset]) if offset is not None else None
+                result = datetime(y, mo, d, h, mi, s, 0, tzinfo)
+            except ValueError:
+                # Let strptime decide what to do with values out of range, like Feb 30
+                results.append(self.parse_with_strptime(date, epoch))
+                continue
+            results.append(DSparser.get_epoch(result) if epoch else result)
+
+        # All done!
+        return results
+
+    def parse_all_array(self, dates, epoch=False):
+        '''Parse many date strings into a NumPy array. Requires NumPy.
+        When every date string has the same length and every directive in
+        the format is numeric with a fixed width (%Y %y %m %d %H %M %S and
+        %z, like '%Y-%m-%d %H:%M:%S'), the date strings are copied into one
+        byte array and the digits for all of them are read at once.
+        Otherwise, or if any date string doesn't fit that layout or has
+        values out of range, it falls back to parse_all.
+        Returns a datetime64[s] array, or an int64 array of seconds since the
+        unix epoch if epoch is True. Date strings with a timezone offset are
+        converted to UTC, and those without are taken to be in UTC.
+        Raises a ValueError if any date string doesn't match the format,
+        same as datetime.strptime.
+
+        :param dates: An iterable of date strings.
+        :param epoch: (optional) If True, return seconds since the unix epoch
+            instead of datetime64 values. Defaults to False.
+        '''
+        import numpy
+        dates = list(dates)
+        seconds = self.get_array_seconds(dates, numpy)
+        if seconds is None:
+            seconds = numpy.array(self.parse_all(dates, epoch=True), dtype=numpy.int64)
+        return seconds if epoch else seconds.astype('datetime64[s]')
+
+    def get_array_layout(self, dates):
+        '''Returns a dict mapping each directive in the format to where its
+        digits start in the date strings, if they can be read by position by
+        parse_all_array, or None if they can't. The positions are taken from
+        the first date string.'''
+        if self.pattern is None or not dates or not set(self.fields).issubset(DSparser.ARRAY_WIDTHS):
+            return None
+        found = self.pattern.match(dates[0])
+        if found is None:
+            return None
+        layout = {}
+        for directive, group in self.fields.items():
+            start, end = found.span(group + 1)
+            if end - start != DSparser.ARRAY_WIDTHS[directive]:
+                return None
+            layout[directive] = start
+        return layout
+
+    def get_array_seconds(self, dates, numpy):
+        '''Used by parse_all_array to read fixed-width date strings by
+        position. Returns an int64 array of seconds since the unix epoch, or
+        None if the date strings don't all fit the layout of the first one
+        or any values are out of range.'''
+
+        # Copy the date strings into a two-dimensional array of bytes, one row per date string
+        layout = self.get_array_layout(dates)
+        if layout is None:
+            return None
+        length = len(dates[0])
+        if len(set(map(len, dates))) != 1:
+            return None
+        try:
+            data = numpy.array(dates, dtype='S' + str(length)).view(numpy.uint8).reshape(len(dates), length)
+        except UnicodeError:
+            return None
+
+        # Every row should have digits where the first one does, and the same bytes everywhere else
+        digits = []
+        for directive, start in layout.items():
+            first = start + 1 if directive == '%z' else start
+            digits.extend(range(first, start + DSparser.ARRAY_WIDTHS[directive]))
+        digitset = set(digits)
+        others = [i for i in range(length) if i not in digitset]
+        if not (data[:, digits] - 48 <= 9).all() or not (data[:, others] == data[0, others]).all():
+            return None
+        def number(start, width):
+            value = numpy.zeros(len(dates), dtype=numpy.int64)
+            for i in range(start, start + width):
+                value = value * 10 + data[:, i] - 48
+            return value
+        def field(directive, default):
+            if directive in layout:
+                return number(layout[directive], DSparser.ARRAY_WIDTHS[directive])
+            return numpy.full(len(dates), default, dtype=numpy.int64)
+
+        # Read the fields, with the same defaults as strptime
+        if '%y' in layout:
+            year = field('%y', 0)
+            year += numpy.where(year <= 68, 2000, 1900)
+        else:
+            year = field('%Y', 1900)
+        month = field('%m', 1)
+        day = field('%d', 1)
+        hour = field('%H', 0)
+        minute = field('%M', 0)
+        second = field('%S', 0)
+        offset = numpy.zeros(len(dates), dtype=numpy.int64)
+        if '%z' in layout:
+            start = layout['%z']
+            offhours = number(start + 1, 2)
+            offminutes = number(start + 3, 2)
+            if (offhours > 23).any() or (offminutes > 59).any():
+                return None
+            offset = (offhours * 3600 + offminutes * 60) * numpy.where(data[:, start] == ord('-'), -1, 1)
+
+        # Leave anything out of range to parse_all, so it fails the same way strptime does
+        months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+        monthdays = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(numpy.int64)
+        valid = (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= monthdays) & (hour <= 23) & (minute <= 59) & (second <= 59)
+        if not valid.all():
+            return None
+
+        # Add everything up
+        days = months.astype('datetime64[D]').astype(numpy.int64) + day - 1
+        return days * 86400 + hour * 3600 + minute * 60 + second - offset
+
+    def parse_with_strptime(self, date_string, epoch=False):
+        '''Parse a single date string with datetime.strptime.
+        Returns a datetime object, or seconds since the unix epoch if epoch
+        is True.'''
+        result = datetime.strptime(date_string, self.format_string)
+        return DSparser.get_epoch(result) if epoch else result
+
+    def get_tzinfo(self, text):
+        '''Returns a tzinfo object for a timezone offset like '+0100'.'''
+        tzinfo = self.tzinfos.get(text)
+        if tzinfo is None:
+            minutes = int(text[1:3]) * 60 + int(text[3:5])
+            tzinfo = timezone(timedelta(minutes=-minutes if text[0] == '-' else minutes))
+            self.tzinfos[text] = tzinfo
+        return tzinfo
+
+    @staticmethod
+    def get_epoch(moment):
+        '''Returns the number of seconds since the unix epoch for a datetime
+        object, taking a datetime without a timezone to be in UTC.'''
+        seconds = (moment.toordinal() - DSparser.EPOCH_ORDINAL) * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+        offset = moment.utcoffset()
+        if offset:
+            seconds -= offset.days * 86400 + offset.seconds
+        return seconds
@@ -0,0 +1,164 @@
+'''Contains DSFormatRegistry class for DateSense package.'''
+
+
+
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+
+class DSFormatRegistry(object):
+    '''A DSFormatRegistry object remembers the results of processing culled
+    token possibility data in an SQLite database file, so that they survive
+    after the program exits. It can be used anywhere a DSFormatCache can,
+    for example by passing it to DSoptions.detect_format, and a new process
+    that opens the same file won't need to apply the rules again for data
+    that looks just like something that's been seen before.
+    Results are keyed by a hash of the fingerprint of the culled data (see
+    DSoptions.get_fingerprint) along with a signature made from the
+    attributes of the rule and option objects, the timezone offset
+    directive and the duplicate penalty used to process it. Unlike
+    DSFormatCache, rules and options are compared by what's in them rather
+    than by identity, so equivalent objects created in another process will
+    find the same results.
+    Along with the scores, the format string and the confidence from
+    get_convergence_report are stored for each result, for the sake of
+    anyone looking at the database directly.
+    '''
+
+    def __init__(self, path):
+        '''Constructs a DSFormatRegistry object, creating the database file
+        if it doesn't exist already.
+        Returns the DSFormatRegistry object.
+
+        :param path: The path of the SQLite database file. ':memory:' can be
+            used for a database that isn't saved anywhere.
+        '''
+        self.path = path
+        self.hits = 0
+        '''The number of lookups that found a stored result.'''
+        self.misses = 0
+        '''The number of lookups that didn't.'''
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS formats (key TEXT PRIMARY KEY, format TEXT, confidence REAL, scores TEXT)"
+            )
+
+    @staticmethod
+    def get_value_signature(value):
+        '''Returns a string describing a value, which is the same for equal
+        values in any process. Sets and dicts are sorted, since the order
+        of their items can change from one process to the next, and objects
+        are described by their get_signature method if they have one.
+        Raises a ValueError for an object without a get_signature method or
+        a repr of its own, since the default repr includes where the object
+        is in memory.
+
+        :param value: The value, like an attribute of a rule object.
+        '''
+        if hasattr(value, 'get_signature'):
+            return value.__class__.__name__ + '(' + value.get_signature() + ')'
+        if isinstance(value, (list, tuple)):
+            return '[' + ', '.join([DSFormatRegistry.get_value_signature(item) for item in value]) + ']'
+        if isinstance(value, (set, frozenset)):
+            return '{' + ', '.join(sorted([DSFormatRegistry.get_value_signature(item) for item in value])) + '}'
+        if isinstance(value, dict):
+            return '{' + ', '.join(sorted([DSFormatRegistry.get_value_signature(key) + ': ' + DSFormatRegistry.get_value_signature(item) for key, item in value.items()])) + '}'
+        if value.__class__.__repr__ is object.__repr__:
+            raise ValueError("Can't make a signature for a " + value.__class__.__name__ + " object; give it a get_signature method")
+        return repr(value)
+
+    @staticmethod
+    def get_rule_signature(rule):
+        '''Returns a string describing a rule object, which is the same for
+        equivalent rules in any process. Rules can define a get_signature
+        method returning a string to describe themselves; otherwise they're
+        described by their class name and attributes. (See
+        get_value_signature.)'''
+        if hasattr(rule, 'get_signature'):
+            return DSFormatRegistry.get_value_signature(rule)
+        attributes = sorted(vars(rule).items())
+        return rule.__class__.__name__ + '(' + ', '.join([name + '=' + DSFormatRegistry.get_value_signature(value) for name, value in attributes]) + ')'
+
+    @staticmethod
+    def get_config_signature(options, dupepenalty):
+        '''Returns a string describing the parser options of a DSoptions
+        object and a duplicate penalty, which is the same for equivalent
+        options in any process.
+        Raises a ValueError if a rule has an attribute that can't be
+        described that way. (See get_value_signature.)
+        '''
+        rules = [DSFormatRegistry.get_rule_signature(rule) for rule in options.formatrules]
+        numoptions = [(option.directive, option.common, tuple(option.numrange)) for option in options.numoptions]
+        wordoptions = [(option.directive, option.common, DSFormatRegistry.get_value_signature(option.words), option.matchlength) for option in options.wordoptions]
+        return repr((rules, numoptions, wordoptions, options.tzoffsetdirective, dupepenalty))
+
+    def get_key(self, options, dupepenalty):
+        '''Returns the key used to store the results for a DSoptions object.'''
+        signature = repr(options.get_fingerprint()) + self.get_config_signature(options, dupepenalty)
+        return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    def lookup(self, options, dupepenalty):
+        '''Look for a stored result for a DSoptions object. If there is one,
+        the scores of its token possibilities are set accordingly.
+        Returns True if a stored result was found, False otherwise.
+
+        :param options: A DSoptions object that's been initialized but not
+            processed.
+        :param dupepenalty: The duplicate penalty it would be processed with.
+        '''
+        key = self.get_key(options, dupepenalty)
+        with self.lock:
+            row = self.connection.execute("SELECT scores FROM formats WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+        options.set_scores(json.loads(row[0]))
+        return True
+
+    def store(self, options, dupepenalty):
+        '''Store the result of processing a DSoptions object.
+
+        :param options: A DSoptions object that's just been processed.
+        :param dupepenalty: The duplicate penalty it was processed with.
+        '''
+        key = self.get_key(options, dupepenalty)
+        row = (key, options.get_format_string(), options.get_convergence_report()['confidence'], json.dumps(options.get_scores()))
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO formats (key, format, confidence, scores) VALUES (?, ?, ?, ?)", row)
+
+    def get_formats(self):
+        '''Returns a list of (format string, confidence) tuples, one for
+        each stored result.'''
+        with self.lock:
+            return self.connection.execute("SELECT format, confidence FROM formats").fetchall()
+
+    def clear(self):
+        '''Delete all stored results and reset the hit and miss counters.'''
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM formats")
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        '''Close the database file. The object can't be used afterward.'''
+        with self.lock:
+            self.connection.close()
+
+    def get_stats(self):
+        '''Returns a dict with the number of hits, misses, and stored results
+        ('hits', 'misses', 'size').'''
+        size = len(self)
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM formats").fetchone()[0]
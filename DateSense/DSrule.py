@@ -10,6 +10,73 @@ from .DStoken import DStoken
 # feel free to implement your own! The only strictly necessary component
 # of a DSrule class is that it has an apply(self, options) method
 # where options is a DSoptions object.
+# Optionally, a rule can also have an inputs attribute listing what the
+# changes it makes to scores depend on, which lets a DSRuleMemo skip
+# applying it again when none of those have changed. See DSRuleMemo.
+
+
+
+class DSRuleIndex(object):
+    '''Rule indexes keep track of where each possibility appears in the
+    allowed attribute of a DSoptions object, so that rules only need to
+    look at the positions where their directives can actually match
+    instead of scanning every possibility at every position.
+    DSoptions.apply_rules builds one index and shares it between all the
+    rules it applies; rules get it by calling options.get_rule_index().
+    Rules only change scores, never which possibilities are where, so the
+    index stays valid while they're being applied.
+    '''
+    
+    def __init__(self, allowed):
+        '''Constructs a DSRuleIndex object.
+        Returns the DSRuleIndex object.
+        
+        :param allowed: The allowed attribute of a DSoptions object.
+        '''
+        self.positions = {}
+        '''Maps the text of each possibility to a list of (position, DStoken)
+        tuples for every place it appears, in order of position.'''
+        self.matches = {}
+        '''Caches the results of get_matching_texts.'''
+        for i in range(0,len(allowed)):
+            for tok in allowed[i]:
+                located = self.positions.get(tok.text)
+                if located is None:
+                    self.positions[tok.text] = [(i, tok)]
+                else:
+                    located.append((i, tok))
+    
+    def get_matching_texts(self, match):
+        '''Returns a frozenset of the possibility texts in the index that
+        rules would consider a match, i.e. every text for which the
+        expression (text in match) is true. When match is a tuple this means
+        any text equal to one of its items, and when match is a string it
+        means any text that's a substring of it, just like rules do when
+        checking possibilities one by one.
+        
+        :param match: A directive or set of directives, like '%S' or
+            ('%H','%I').
+        '''
+        try:
+            return self.matches[match]
+        except KeyError:
+            matching = frozenset([text for text in self.positions if text in match])
+            self.matches[match] = matching
+            return matching
+        except TypeError: # Unhashable, like a list
+            return frozenset([text for text in self.positions if text in match])
+        
+    def get_tokens(self, match):
+        '''Returns a list of (position, DStoken) tuples for every
+        possibility whose text matches as described by get_matching_texts.
+        
+        :param match: A directive or set of directives, like '%S' or
+            ('%H','%I').
+        '''
+        located = []
+        for text in self.get_matching_texts(match):
+            located.extend(self.positions[text])
+        return located
 
 
 
@@ -20,6 +87,9 @@ class DSDelimiterRule(object):
     attribute of DSoptions objects are evaluated during parsing.
     '''
     
+    # Only depends on which possibilities are where (See DSRuleMemo.)
+    inputs = ('allowed',)
+    
     def __init__(self, directives, delimiters, posscore=0, negscore=0):
         '''Constructs a DSDelimiterRule object.
         Positive reinforcement: The scores of specified possibilities that
@@ -50,32 +120,22 @@ class DSDelimiterRule(object):
     # Negative reinforcement: Specified possibilities that are not adjacent to one of the specified delimiters
     def apply(self, options):
         '''Applies the rule to the provided DSoptions object by affecting token possibility scores.'''
-        adjacent=[]
+        index = options.get_rule_index()
+        adjacent=set()
         # For each delimiter specified:
         for delimiter in self.delimiters:
-            toklist_count = len(options.allowed)
-            # Determine which date tokens are adjacent to any one that has the delimiter text as a possibility
-            for i in range(0,toklist_count):
-                toklist = options.allowed[i]
-                delimtok=DStoken.get_token_with_text(toklist, delimiter)
-                if delimtok:
-                    if i > 0 and (options.allowed[i-1] not in adjacent):
-                        adjacent.append(options.allowed[i-1])
-                    if i < toklist_count-1 and (options.allowed[i+1] not in adjacent):
-                        adjacent.append(options.allowed[i+1])
+            # Determine which positions are adjacent to any one that has the delimiter text as a possibility
+            for i, delimtok in index.get_tokens(delimiter):
+                adjacent.add(i-1)
+                adjacent.add(i+1)
         # Affect scores of possibilities specified
-        for toklist in options.allowed:
+        for i, tok in index.get_tokens(self.directives):
             # Positive reinforcement
-            if toklist in adjacent:
-                if self.posscore:
-                    for tok in toklist:
-                        if tok.text in self.directives:
-                            tok.score += self.posscore
+            if i in adjacent:
+                tok.score += self.posscore
             # Negative reinforcement
-            elif self.negscore:
-                for tok in toklist:
-                    if tok.text in self.directives:
-                        tok.score += self.negscore
+            else:
+                tok.score += self.negscore
     
     
 
@@ -87,6 +147,9 @@ class DSLikelyRangeRule(object):
     attribute of DSoptions objects are evaluated during parsing.
     '''
     
+    # Depends on which possibilities are where and the ranges of numbers seen (See DSRuleMemo.)
+    inputs = ('allowed', 'numranges')
+    
     def __init__(self, directives, likelyrange, posscore=0, negscore=0):
         '''Constructs a DSLikelyRangeRule object.
         Positive reinforcement: The scores of specified directives where
@@ -120,19 +183,16 @@ class DSLikelyRangeRule(object):
     # Negative reinforcement: Directives outside the likely range
     def apply(self, options):
         '''Applies the rule to the provided DSoptions object by affecting token possibility scores.'''
-        # Iterate through the token possibilities
-        toklist_count = len(options.allowed)
-        for i in range(0,toklist_count):
-            toklist = options.allowed[i]
-            for tok in toklist:
-                # If the possibility is a number and matches the argument, check whether the encoutered data was all inside the likely range.
-                if tok.kind == DStoken.KIND_NUMBER and tok.text in self.directives:
-                    # Positive reinforcement
-                    if options.numranges[i][0] >= self.likelyrange[0] and options.numranges[i][1] <= self.likelyrange[1]:
-                        tok.score += self.posscore
-                    # Negative reinforcement
-                    else:
-                        tok.score += self.negscore
+        # Iterate through the token possibilities matching the argument
+        for i, tok in options.get_rule_index().get_tokens(self.directives):
+            # If the possibility is a number, check whether the encoutered data was all inside the likely range.
+            if tok.kind == DStoken.KIND_NUMBER:
+                # Positive reinforcement
+                if options.numranges[i][0] >= self.likelyrange[0] and options.numranges[i][1] <= self.likelyrange[1]:
+                    tok.score += self.posscore
+                # Negative reinforcement
+                else:
+                    tok.score += self.negscore
     
     
 
@@ -144,6 +204,9 @@ class DSPatternRule(object):
     attribute of DSoptions objects are evaluated during parsing.
     '''
 
+    # Depends on the scores of possibilities too, since low-scoring directives don't count (See DSRuleMemo.)
+    inputs = ('allowed', 'scores')
+    
     def __init__(self, sequence, maxdistance=1, minmatchscore=0, posscore=0, negscore=0):
         '''Constructs a DSPatternRule object.
         Positive reinforcement: The scores of possibilities comprising
@@ -184,6 +247,9 @@ class DSPatternRule(object):
     # Negative reinforcement: Directive possibilities in the pattern that were not found to be part of an instance of the pattern
     def apply(self, options):
         '''Applies the rule to the provided DSoptions object by affecting token possibility scores.'''
+        index = options.get_rule_index()
+        # Which possibility texts match each part of the pattern?
+        sequence = [index.get_matching_texts(matchtext) for matchtext in self.sequence]
         # Which date token in the pattern are we on?
         onarg = 0
         # How many tokens have we looked over since the last one that's part of the pattern?
@@ -204,7 +270,7 @@ class DSPatternRule(object):
             # (Only consider directives with scores greater than or equal to self.minmatchscore, and decorators of any score)
             foundtok = 0
             for tok in toklist:
-                if (tok.score >= self.minmatchscore or tok.is_decorator()) and tok.text in self.sequence[onarg]:
+                if (tok.score >= self.minmatchscore or tok.is_decorator()) and tok.text in sequence[onarg]:
                     ordered_toks_current.append(tok)
                     foundtok += 1
             # One or more possibilities here match the pattern! On to the next expected possibility in the pattern sequence.
@@ -221,17 +287,15 @@ class DSPatternRule(object):
                 tok.score += self.posscore
         # Negative reinforcement
         if self.negscore:
-            # Iterate through all possibilities for all tokens
-            for toklist in options.allowed:
-                for tok in toklist:
+            ordered_ids = set([id(tok) for tok in ordered_toks])
+            # Iterate through all possibilities matching each part of the pattern
+            for matchtext in self.sequence:
+                for i, tok in index.get_tokens(matchtext):
                     # Is the possibility a directive?
                     if not tok.is_decorator():
-                        # Does the possibility exist anywhere in the pattern?
-                        for matchtext in self.sequence:
-                            if tok.text in matchtext:
-                                # Was it not a part of any found instances of the pattern? If so, whack the score.
-                                if tok not in ordered_toks:
-                                    tok.score += self.negscore
+                        # Was it not a part of any found instances of the pattern? If so, whack the score.
+                        if id(tok) not in ordered_ids:
+                            tok.score += self.negscore
         
 
 
@@ -243,6 +307,9 @@ class DSMutExclusionRule(object):
     attribute of DSoptions objects are evaluated during parsing.
     '''
     
+    # Depends on the scores of possibilities too, to find the highest-scoring one (See DSRuleMemo.)
+    inputs = ('allowed', 'scores')
+    
     def __init__(self, directives, posscore=0, negscore=0):
         '''Constructs a DSMutExclusionRule object.
         Positive reinforcement: The highest-scoring instance of any of the
@@ -271,16 +338,14 @@ class DSMutExclusionRule(object):
     # Negative reinforcement: The highest-scoring instance of any of the specified possibilities specified is found and the scores of all the other possibilities will be affected
     def apply(self, options):
         '''Applies the rule to the provided DSoptions object by affecting token possibility scores.'''
+        index = options.get_rule_index()
         # Find the highest-scoring instance of each token possibility specified
         matchedtoks = []
-        for toklist in options.allowed:
-            for tok in toklist:
-                for i in range(0,len(self.directives)):
-                    matchedtoks.append(None)
-                    matchtext = self.directives[i]
-                    if tok.text in matchtext:
-                        if (not matchedtoks[i]) or tok.score > matchedtoks[i].score:
-                            matchedtoks[i] = tok
+        for i in range(0,len(self.directives)):
+            matchedtoks.append(None)
+            for pos, tok in index.get_tokens(self.directives[i]):
+                if (not matchedtoks[i]) or tok.score > matchedtoks[i].score:
+                    matchedtoks[i] = tok
         # Determine which of the possibilities had the highest score
         highest_tok = None
         highest_index = 0
@@ -291,17 +356,14 @@ class DSMutExclusionRule(object):
                 highest_index = i
         # Affect scores (Ties go to the lowest-index argument.)
         if highest_tok:
-            for toklist in options.allowed:
-                for tok in toklist:
-                    for i in range(0,len(self.directives)):
-                        matchtext = self.directives[i]
-                        if tok.text in matchtext:
-                            # Positive reinforcement
-                            if i == highest_index:
-                                tok.score += self.posscore
-                            # Negative reinforcement
-                            else:
-                                tok.score += self.negscore
+            for i in range(0,len(self.directives)):
+                for pos, tok in index.get_tokens(self.directives[i]):
+                    # Positive reinforcement
+                    if i == highest_index:
+                        tok.score += self.posscore
+                    # Negative reinforcement
+                    else:
+                        tok.score += self.negscore
 
             
     
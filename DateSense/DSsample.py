@@ -0,0 +1,188 @@
+'''Contains DSsampler class for DateSense package.'''
+
+
+
+import itertools
+import math
+import random
+
+
+
+class DSsampler(object):
+    '''A DSsampler object detects formats from a random sample of date
+    strings instead of all of them, for data sets too big to cull every
+    row of. Reading through a date string is much cheaper than tokenizing
+    and culling it, so the sampler reads the input once, keeping a uniform
+    random sample of a fixed number of rows (a reservoir sample), and only
+    culls the rows in the sample.
+    The possibilities mostly depend on a few rows, like the first one with
+    a day above 12 that rules out '%m', so while the sample is culled the
+    rows that removed possibilities or widened the range of numbers seen
+    somewhere are kept in the retained attribute, and the number of rows
+    culled since the last of them is tracked. Since the sample is in random
+    order, that's a fair estimate of how likely another row from the input
+    would be to change anything (see get_report), unlike the stable rows
+    of culling a data set from the beginning, which might be sorted.
+    The retained rows can be given to a new DSsampler object, for sampling
+    the same data set again or another part of it, and they're culled
+    before its sample so the rows that mattered aren't left to chance.
+    Pass a DSsampler object to DSoptions.detect_format or initialize to
+    use it.
+    '''
+
+    def __init__(self, budget, seed=0, limit=None, patience=None, retained=None):
+        '''Constructs a DSsampler object.
+        Returns the DSsampler object.
+
+        :param budget: The most date strings to cull, counting the first
+            one, which is always used to seed the possibilities.
+        :param seed: (optional) The seed for choosing the sample, so that
+            the same input always gives the same result. Defaults to 0.
+            None means a different sample every time.
+        :param limit: (optional) The most date strings to read, for reading
+            only part of a very large input. Defaults to None, meaning all
+            of it is read.
+        :param patience: (optional) If set, stop culling the sample once
+            this many rows in a row haven't changed anything. Defaults to
+            None, meaning the whole sample is culled.
+        :param retained: (optional) Date strings to cull right after the
+            first one and before the sample, like the retained attribute of
+            a DSsampler object used on the same data set. They count toward
+            the budget, and if there are too many only the first ones are
+            used. Defaults to None.
+        Raises a ValueError if the budget is less than 1.
+        '''
+        if budget < 1:
+            raise ValueError("The budget must be at least 1, for the first date string")
+        self.budget = budget
+        self.seed = seed
+        self.limit = limit
+        self.patience = patience
+        self.prior = list(retained) if retained else []
+        '''The date strings given by the retained param.'''
+        self.retained = []
+        '''The date strings in the sample that removed possibilities or
+        widened the range of numbers seen somewhere, in the order they were
+        culled. The first date string is always one of them.'''
+        self.read = 0
+        '''The number of date strings read.'''
+        self.sampled = 0
+        '''The number of date strings in the sample, counting the first.'''
+        self.culled = 0
+        '''The number of date strings culled, counting the first and the
+        ones given by the retained param.'''
+        self.stablerows = 0
+        '''The number of date strings culled since the last one that
+        changed anything.'''
+        self.exhausted = True
+        '''False if some of the input wasn't culled, True otherwise.'''
+
+    def get_sample(self, dates, size):
+        '''Read through some date strings and choose a uniform random sample
+        of them, using Algorithm L so that only a few random numbers are
+        needed for each row that makes it into the sample.
+        Returns a list of the chosen date strings, in random order.
+
+        :param dates: An iterator of date strings.
+        :param size: The number of date strings to choose.
+        '''
+        generator = random.Random(self.seed)
+        sample = list(itertools.islice(dates, size))
+        self.read += len(sample)
+        if size > 0 and len(sample) == size:
+            weight = math.exp(math.log(1.0 - generator.random()) / size)
+            while weight < 1.0:
+                # Skip ahead to the next row that replaces one in the sample
+                skip = int(math.log(1.0 - generator.random()) / math.log(1.0 - weight))
+                skipped = 0
+                for date in itertools.islice(dates, skip):
+                    skipped += 1
+                self.read += skipped
+                date = next(dates, None) if skipped == skip else None
+                if date is None:
+                    break
+                self.read += 1
+                sample[generator.randrange(size)] = date
+                weight *= math.exp(math.log(1.0 - generator.random()) / size)
+        generator.shuffle(sample)
+        return sample
+
+    def sample(self, options, dates):
+        '''Initialize a DSoptions object's possibilities with the first date
+        string and cull them with a random sample of the rest. The rows
+        attribute of the DSoptions object is the number of date strings that
+        were culled, and its exhausted attribute is False if some of the
+        input wasn't.
+        The counts and retained rows from sampling before are reset, but the
+        date strings given by the retained param are culled every time.
+        Returns the DSoptions object.
+
+        :param options: The DSoptions object.
+        :param dates: A set of identically-formatted date strings. Can be any
+            iterable of strings.
+        '''
+        self.retained = []
+        self.read = 0
+        self.sampled = 0
+        self.culled = 0
+        self.stablerows = 0
+        self.exhausted = True
+        dates = iter(dates)
+        if self.limit is not None:
+            dates = itertools.islice(dates, self.limit)
+        first = next(dates, None)
+        if first is None:
+            return options
+        self.read += 1
+        prior = self.prior[:self.budget - 1]
+        sample = [first] + self.get_sample(dates, self.budget - 1 - len(prior))
+        self.sampled = len(sample)
+        # The sample might not have needed to read everything, like when it's just the first date string
+        leftover = next(dates, None) is not None
+        if leftover:
+            self.read += 1
+        # Cull the rows retained before right after the first, since they're likely to change something
+        sample[1:1] = prior
+        inputculled = 0
+        for date in sample:
+            if self.patience is not None and self.culled and self.stablerows >= self.patience:
+                break
+            if not 0 < self.culled <= len(prior):
+                inputculled += 1
+            self.culled += 1
+            if options.update(date):
+                self.retained.append(date)
+                self.stablerows = 0
+            else:
+                self.stablerows += 1
+        # It's only exhausted if every row got culled, there weren't any left, and the limit didn't stop it from reading them all
+        self.exhausted = inputculled == self.read and not leftover and (self.limit is None or self.read < self.limit)
+        options.exhausted = self.exhausted
+        options.cull_decorators()
+        return options
+
+    def get_report(self):
+        '''Returns a dict describing how the sample went: the number of date
+        strings read ('read'), chosen for the sample ('sampled'), culled
+        ('culled') and retained ('retained'), how many were culled since
+        the last one that changed anything ('stable_rows'), an estimate of
+        the probability that another row from the input wouldn't change
+        anything ('confidence') and whether that's high enough to consider
+        the format settled ('settled').
+        The confidence is 1.0 if all of the input was culled, otherwise it's
+        estimated from the stable rows by the rule of succession, and the
+        format is considered settled when the confidence is at least 0.99.
+        '''
+        if self.exhausted:
+            confidence = 1.0
+        else:
+            confidence = 1.0 - 1.0 / (self.stablerows + 2)
+        return {
+            'read': self.read,
+            'sampled': self.sampled,
+            'culled': self.culled,
+            'retained': len(self.retained),
+            'stable_rows': self.stablerows,
+            'confidence': confidence,
+            'settled': confidence >= 0.99
+        }
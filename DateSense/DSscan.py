@@ -0,0 +1,303 @@
+'''Contains functions for detecting the format of a column of date strings
+in a file for DateSense package.
+The file is memory-mapped instead of read line by line, and each date
+string is split into tokens right where it lies in the file, so no string
+is made for each line or field (unless dedupe is used, which has to keep
+each distinct field's bytes); only the text of each distinct token is
+decoded, once. Big files can be divided into byte ranges that are culled
+in parallel by a pool of worker processes.
+'''
+
+
+
+import mmap
+import re
+
+from .DStoken import DStoken
+from .DSoptions import DSoptions
+from .DSbitset import DSbitset
+
+
+
+# Splits date strings the same way as DStoken.TOKEN_PATTERN, but for bytes
+BYTE_TOKEN_PATTERN = re.compile(br'[0-9]+|[a-zA-Z]+|[+\-]|[^0-9a-zA-Z+\-]+')
+
+# The most distinct token texts remembered by tokenize_bytes
+DECODED_CACHE_SIZE = 65536
+
+# How many byte ranges detect_format_for_file divides a file into for each worker process, so that they finish at about the same time
+CHUNKS_PER_WORKER = 4
+
+
+
+def get_field_pattern(column=None, delimiter=b','):
+    '''Returns a compiled pattern matching one field of each line, with the
+    field's contents in group 1 if it's quoted and group 2 if it isn't.
+
+    :param column: (optional) The index of the field, counting from 0.
+        Defaults to None, meaning the whole line is one field.
+    :param delimiter: (optional) The bytes between fields. Defaults to b','.
+    '''
+    if column is None:
+        return re.compile(br'^(?:"([^"\r\n]*)"|([^\r\n]*))', re.M)
+    delimiter = re.escape(delimiter)
+    field = br'(?:"[^"\r\n]*"|[^"\r\n' + delimiter + br']*)'
+    return re.compile(br'^(?:' + field + delimiter + br'){' + str(column).encode('ascii') + br'}(?:"([^"\r\n]*)"|([^"\r\n' + delimiter + br']*))', re.M)
+
+def get_field_spans(buffer, column=None, delimiter=b',', skiprows=0, start=0, end=None):
+    '''Finds a field in each line of a buffer.
+    Yields a (start, end) tuple for each line where the field is there and
+    isn't empty.
+
+    :param buffer: A bytes, bytearray, mmap or other buffer.
+    :param column: (optional) See get_field_pattern.
+    :param delimiter: (optional) See get_field_pattern.
+    :param skiprows: (optional) The number of lines to skip first, like a
+        header. Defaults to 0.
+    :param start: (optional) Where in the buffer to start. This should be
+        the beginning of a line. Defaults to 0.
+    :param end: (optional) Where in the buffer to stop. Defaults to None,
+        meaning the end of the buffer.
+    '''
+    end = len(buffer) if end is None else end
+    for i in range(0,skiprows):
+        newline = buffer.find(b'\n', start, end)
+        start = end if newline < 0 else newline + 1
+    for match in get_field_pattern(column, delimiter).finditer(buffer, start, end):
+        group = 1 if match.start(1) >= 0 else 2
+        if match.end(group) > match.start(group):
+            yield match.span(group)
+
+def tokenize_bytes(buffer, start, end, decoded, encoding='utf-8'):
+    '''Tokenizes a date string in a buffer without making a string of it,
+    the same way as DStoken.tokenize_date_compact.
+    Returns a list of (kind, text) tuples.
+
+    :param buffer: A bytes, bytearray, mmap or other buffer.
+    :param start: Where the date string starts in the buffer.
+    :param end: Where it ends.
+    :param decoded: A dict mapping the bytes of token texts to (kind,
+        text) tuples. Add to the same one for every call so each distinct
+        token text is only decoded once.
+    :param encoding: (optional) The encoding of the buffer. Defaults to
+        'utf-8'.
+    '''
+    raws = BYTE_TOKEN_PATTERN.findall(buffer, start, end)
+    # Look up all the tokens at once, then decode the ones that weren't there
+    date_tokens = list(map(decoded.get, raws))
+    if None in date_tokens:
+        for i in range(0,len(raws)):
+            if date_tokens[i] is None:
+                text = raws[i].decode(encoding, 'replace')
+                date_tokens[i] = (DStoken.CHARACTER_KINDS.get(text[0], DStoken.KIND_DECORATOR), text)
+                if len(decoded) < DECODED_CACHE_SIZE:
+                    decoded[raws[i]] = date_tokens[i]
+    if b'+' in raws or b'-' in raws:
+        kinds, texts = DStoken.join_timezones([kind for kind, text in date_tokens], [text for kind, text in date_tokens])
+        return list(zip(kinds, texts))
+    return date_tokens
+
+def cull_with_buffer(target, buffer, column=None, delimiter=b',', skiprows=0, start=0, end=None, budget=None, dedupe=False, encoding='utf-8'):
+    '''Seed and cull token possibilities with the date strings in a column
+    of a buffer. If the possibilities haven't been seeded yet, the first
+    date string is used to seed them.
+    Returns the number of date strings used.
+
+    :param target: A DSoptions or DSbitset object.
+    :param buffer: A bytes, bytearray, mmap or other buffer.
+    :param column: (optional) See get_field_pattern.
+    :param delimiter: (optional) See get_field_pattern.
+    :param skiprows: (optional) See get_field_spans.
+    :param start: (optional) See get_field_spans.
+    :param end: (optional) See get_field_spans.
+    :param budget: (optional) If set, stop once the total number of date
+        strings used (as tracked by the rows attribute) reaches this many,
+        and set the exhausted attribute to False if there were any left.
+        Defaults to None, meaning there's no limit.
+    :param dedupe: (optional) If True, date strings that were already seen
+        are skipped, same as DSoptions.cull_with_dates. This copies the
+        bytes of each field to look it up, so it's only worth it when there
+        are lots of repeated date strings. Defaults to False.
+    :param encoding: (optional) See tokenize_bytes.
+    '''
+    decoded = {}
+    seen = set() if dedupe else None
+    rows = target.rows
+    for field_start, field_end in get_field_spans(buffer, column, delimiter, skiprows, start, end):
+        # Stop here if the sample budget ran out
+        if budget is not None and target.rows >= budget:
+            target.exhausted = False
+            break
+        # Skip date strings that were already seen
+        if seen is not None and target.rows:
+            field = buffer[field_start:field_end]
+            if field in seen:
+                target.rows += 1
+                target.stablerows += 1
+                continue
+            if len(seen) < DSoptions.DEDUPE_CACHE_SIZE:
+                seen.add(field)
+        date_tokens = tokenize_bytes(buffer, field_start, field_end, decoded, encoding)
+        if target.rows:
+            target.cull_with_date_tokens(date_tokens)
+        else:
+            target.init_with_date_tokens(date_tokens)
+    return target.rows - rows
+
+def open_buffer(datafile):
+    '''Returns a read-only memory map of an open file, or an empty bytes
+    object if the file is empty, since empty files can't be memory-mapped.'''
+    try:
+        return mmap.mmap(datafile.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return b''
+
+def scan_file(target, path, column=None, delimiter=b',', skiprows=0, start=0, end=None, budget=None, dedupe=False, encoding='utf-8'):
+    '''Seed and cull token possibilities with the date strings in a column
+    of part or all of a file, using cull_with_buffer on a memory map of it.
+    Returns the number of date strings used.
+
+    :param target: A DSoptions or DSbitset object.
+    :param path: The path of the file.
+    The other arguments are the same as for cull_with_buffer.
+    '''
+    with open(path, 'rb') as datafile:
+        buffer = open_buffer(datafile)
+        try:
+            return cull_with_buffer(target, buffer, column, delimiter, skiprows, start, end, budget, dedupe, encoding)
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+def get_chunks(path, count, skiprows=0):
+    '''Divide a file into byte ranges of about the same size which each
+    begin at the beginning of a line.
+    Returns a list of up to count (start, end) tuples.
+
+    :param path: The path of the file.
+    :param count: The number of ranges to divide it into.
+    :param skiprows: (optional) The number of lines at the start of the file
+        to leave out of the first range, like a header. Defaults to 0.
+    '''
+    with open(path, 'rb') as datafile:
+        buffer = open_buffer(datafile)
+        try:
+            size = len(buffer)
+            start = 0
+            for i in range(0,skiprows):
+                newline = buffer.find(b'\n', start)
+                start = size if newline < 0 else newline + 1
+            chunks = []
+            step = max(1, (size - start) // count)
+            while start < size:
+                # Move the end of the range to just after the next newline
+                newline = buffer.find(b'\n', min(start + step, size) - 1)
+                end = size if newline < 0 or len(chunks) == count - 1 else newline + 1
+                chunks.append((start, end))
+                start = end
+            return chunks
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+def scan_chunk(chunk):
+    '''Seed and cull token possibilities with the date strings in one byte
+    range of a file. Used by worker processes in detect_format_for_file.
+    Returns the culled token possibility data, as returned by
+    DSoptions.get_state.
+
+    :param chunk: A (config, path, start, end, column, delimiter, budget,
+        dedupe, bitset, encoding) tuple, where config is a (formatRules,
+        numOptions, wordOptions, tzOffsetDirective) tuple.
+    '''
+    config, path, start, end, column, delimiter, budget, dedupe, bitset, encoding = chunk
+    options = DSoptions(*config)
+    target = DSbitset(options) if bitset else options
+    scan_file(target, path, column, delimiter, 0, start, end, budget, dedupe, encoding)
+    if bitset:
+        target.materialize()
+    return options.get_state()
+
+def detect_format_for_file(path, column=None, delimiter=b',', skiprows=0, budget=None, dedupe=False, bitset=False, encoding='utf-8', formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None, workers=1):
+    '''Detect the format of a column of date strings in a file, like a CSV
+    or log file. The file is memory-mapped and each date string is
+    tokenized where it lies, so it doesn't need to be read into memory or
+    decoded line by line.
+    With more than one worker, the file is divided into byte ranges that
+    begin at the beginning of a line, each range is culled in a pool of
+    worker processes, and the results are combined with DSoptions.merge
+    before the rules are applied, once. If a range's first date string has
+    fewer tokens than the file's first one, merging can't give the same
+    result as culling the whole file in order (see DSoptions.merge), so
+    the file is scanned again in this process instead.
+    Returns a DSoptions object containing date format information.
+
+    :param path: The path of the file.
+    :param column: (optional) The index of the column holding the date
+        strings, counting from 0. Fields in double quotes may contain the
+        delimiter. Defaults to None, meaning each whole line is a date
+        string.
+    :param delimiter: (optional) The bytes between columns. Defaults to
+        b','.
+    :param skiprows: (optional) The number of lines to skip at the start,
+        like a header. Defaults to 0.
+    :param budget: (optional) See DSoptions.detect_format. With more than
+        one worker, it's divided as evenly as possible between the byte
+        ranges, so the date strings used are spread out over the file, and
+        ranges left without any budget aren't scanned at all.
+    :param dedupe: (optional) If True, date strings that were already seen
+        are skipped. See cull_with_buffer. Defaults to False.
+    :param bitset: (optional) If True, cull the possibilities using a
+        DSbitset. See DSoptions.initialize. Defaults to False.
+    :param encoding: (optional) The encoding of the file. Defaults to
+        'utf-8'.
+    :param formatRules: (optional) See DSoptions.detect_format.
+    :param numOptions: (optional) See DSoptions.detect_format.
+    :param wordOptions: (optional) See DSoptions.detect_format.
+    :param tzOffsetDirective: (optional) See DSoptions.detect_format.
+    :param workers: (optional) The number of worker processes to use. If
+        set to 1 the file is scanned in this process without starting a
+        pool. Defaults to 1. None means the number of processors.
+    '''
+    options = DSoptions.create_with_defaults(formatRules, numOptions, wordOptions, tzOffsetDirective)
+
+    # Just do it here if there's only one worker
+    if workers == 1:
+        target = DSbitset(options) if bitset else options
+        scan_file(target, path, column, delimiter, skiprows, budget=budget, dedupe=dedupe, encoding=encoding)
+        if bitset:
+            target.materialize()
+        options.cull_decorators()
+        options.process()
+        return options
+
+    # Otherwise divide the file up, scan each range in a pool, and merge the results in order
+    import concurrent.futures
+    import multiprocessing
+    workers = workers if workers else multiprocessing.cpu_count()
+    config = (options.formatrules, options.numoptions, options.wordoptions, options.tzoffsetdirective)
+    chunks = get_chunks(path, workers * CHUNKS_PER_WORKER, skiprows)
+    # Divide the budget so the ranges' budgets add up to it exactly, leaving out ranges that don't get any
+    if budget is not None:
+        budgets = [budget // len(chunks) + (1 if i < budget % len(chunks) else 0) for i in range(0,len(chunks))]
+    else:
+        budgets = [None] * len(chunks)
+    skipped = budgets.count(0)
+    chunks = [(config, path, start, end, column, delimiter, chunkbudget, dedupe, bitset, encoding) for (start, end), chunkbudget in zip(chunks, budgets) if chunkbudget != 0]
+    mismatched = False
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for state in executor.map(scan_chunk, chunks):
+            chunkoptions = DSoptions(*config)
+            chunkoptions.set_state(state)
+            if options.rows and chunkoptions.rows and len(chunkoptions.allowed) < len(options.allowed):
+                mismatched = True
+                break
+            options = DSoptions.merge(options, chunkoptions)
+    # Fall back to scanning it in order if merging wouldn't give the same result
+    if mismatched:
+        return detect_format_for_file(path, column, delimiter, skiprows, budget, dedupe, bitset, encoding, formatRules, numOptions, wordOptions, tzOffsetDirective, workers=1)
+    if skipped:
+        options.exhausted = False
+    options.cull_decorators()
+    options.process()
+    return options
@@ -0,0 +1,131 @@
+'''Contains DSstats class for DateSense package.'''
+
+
+
+from collections import OrderedDict
+import timeit
+
+
+
+class DSstats(object):
+    '''A DSstats object collects measurements of what happened while
+    detecting a format: how long each phase took, how long each rule took
+    and how much it changed the scores, how many date strings were used to
+    cull the possibilities, how many possibilities culling removed at each
+    position, and after how many date strings nothing more was removed.
+    Pass one to DSoptions.detect_format, or set the stats attribute of a
+    DSoptions object, to collect them. Nothing is measured when there isn't
+    one, so leaving it out costs nothing.
+    Times and score changes add up over every format detected with the same
+    object, while the culling measurements are for the most recent one. For
+    exporting to something else, get_report returns everything as a dict of
+    plain values, and a callback can be given to hear about each
+    measurement as it's made.
+    '''
+
+    def __init__(self, callback=None):
+        '''Constructs a DSstats object.
+        Returns the DSstats object.
+
+        :param callback: (optional) A function that's called with the kind
+            of measurement ('phase', 'rule' or 'culling') and a dict
+            describing it every time one is made. Defaults to None.
+        '''
+        self.callback = callback
+        self.phases = OrderedDict()
+        '''Maps the name of each phase to the total seconds spent in it.'''
+        self.rules = OrderedDict()
+        '''Maps the position and class name of each rule to a dict with the
+        number of times it was applied ('calls'), the total seconds it took
+        ('seconds'), the number of scores it changed ('changed') and the sum
+        of those changes ('delta').'''
+        self.rows = 0
+        '''The number of date strings used to cull the possibilities.'''
+        self.removed = []
+        '''The number of possibilities culling removed at each position.'''
+        self.settledrow = None
+        '''The number of date strings that had been used when culling last
+        removed a possibility. Date strings after that didn't change
+        anything.'''
+
+    @staticmethod
+    def clock():
+        '''Returns the current time in seconds, for timing phases.'''
+        return timeit.default_timer()
+
+    def notify(self, kind, values):
+        '''Pass a measurement to the callback, if there is one.'''
+        if self.callback is not None:
+            self.callback(kind, values)
+
+    def add_phase(self, name, begin):
+        '''Record the time spent in a phase.
+        Returns the current time, so it can be used as the beginning of the
+        next phase.
+
+        :param name: The name of the phase, like 'cull' or 'apply_rules'.
+        :param begin: The time the phase began, as returned by clock.
+        '''
+        end = self.clock()
+        self.phases[name] = self.phases.get(name, 0) + end - begin
+        self.notify('phase', {'phase': name, 'seconds': end - begin})
+        return end
+
+    def add_rule(self, index, rule, seconds, before, after):
+        '''Record the time a rule took and how it changed the scores.
+
+        :param index: The position of the rule in the set being applied.
+        :param rule: The rule object.
+        :param seconds: How long applying it took.
+        :param before: The scores before it was applied, as returned by
+            DSoptions.get_scores.
+        :param after: The scores after it was applied.
+        '''
+        changed = 0
+        delta = 0
+        for toklist_before, toklist_after in zip(before, after):
+            for score_before, score_after in zip(toklist_before, toklist_after):
+                if score_after != score_before:
+                    changed += 1
+                    delta += score_after - score_before
+        key = str(index) + ':' + rule.__class__.__name__
+        totals = self.rules.get(key)
+        if totals is None:
+            totals = {'calls': 0, 'seconds': 0, 'changed': 0, 'delta': 0}
+            self.rules[key] = totals
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['changed'] += changed
+        totals['delta'] += delta
+        self.notify('rule', {'rule': key, 'seconds': seconds, 'changed': changed, 'delta': delta})
+
+    def add_culling(self, options, counts):
+        '''Record what culling did to a DSoptions object's possibilities.
+
+        :param options: The DSoptions object, after culling.
+        :param counts: The number of possibilities at each position before
+            culling, right after they were seeded with the first date string.
+        '''
+        self.rows = options.rows
+        self.removed = [count - len(toklist) for count, toklist in zip(counts, options.allowed)]
+        self.settledrow = options.rows - options.stablerows if options.rows else None
+        self.notify('culling', {'rows': self.rows, 'removed': list(self.removed), 'settledrow': self.settledrow})
+
+    def get_report(self):
+        '''Returns all the measurements as a dict made up of only dicts,
+        lists, strings and numbers, suitable for converting to JSON.'''
+        return {
+            'phases': dict(self.phases),
+            'rules': dict([(key, dict(totals)) for key, totals in self.rules.items()]),
+            'rows': self.rows,
+            'removed': list(self.removed),
+            'settledrow': self.settledrow
+        }
+
+    def clear(self):
+        '''Discard all the measurements.'''
+        self.phases.clear()
+        self.rules.clear()
+        self.rows = 0
+        self.removed = []
+        self.settledrow = None
@@ -2,6 +2,10 @@
 
 
 
+import re
+
+
+
 # Used by the parser for keeping track of what goes where, and what can possibly go where
 class DStoken(object):
     '''DStoken objects are used by the parser for keeping track of what
@@ -16,6 +20,8 @@ class DStoken(object):
     to be.)
     '''
     
+    __slots__ = ('kind', 'text', 'option', 'score')
+    
     
     # Consts for the different kinds of tokens recognized
     KIND_DECORATOR = 0
@@ -25,6 +31,14 @@ class DStoken(object):
     
     # Const for number of characters timezone offset numbers are expected to be, e.g. +0100 or -0300 (You definitely want this value to be 4.)
     TIMEZONE_LENGTH = 4
+    
+    # Used by tokenize_date to split date strings: runs of digits, runs of letters, lone '+' or '-' characters, and runs of anything else
+    TOKEN_PATTERN = re.compile(r'[0-9]+|[a-zA-Z]+|[+\-]|[^0-9a-zA-Z+\-]+')
+    
+    # Used by tokenize_date to look up token kinds by their first character
+    CHARACTER_KINDS = dict.fromkeys('0123456789', KIND_NUMBER)
+    CHARACTER_KINDS.update(dict.fromkeys('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', KIND_WORD))
+    CHARACTER_KINDS.update(dict.fromkeys('+-', KIND_TIMEZONE))
 
 
     
@@ -138,6 +152,87 @@ class DStoken(object):
         would be tokenized like so: '12', ' ', '34', 'Abc', '?', '+1000'.
         Returns a list of DStoken objects.
         
+        :param date_string: The date string to be tokenized.
+        '''
+        kinds, texts = DStoken.split_date(date_string)
+        return list(map(DStoken, kinds, texts))
+        
+    @staticmethod
+    def tokenize_date_compact(date_string):
+        '''Tokenizes a date string the same way as tokenize_date, but
+        returns a list of (kind, text) tuples instead of DStoken objects.
+        Tokenized date strings don't need the option and score data that's
+        only meaningful for possibilities, and plain tuples are much cheaper
+        to create for every date string that gets culled. These can be
+        passed to DSoptions methods wherever tokenized date strings are
+        expected.
+        
+        :param date_string: The date string to be tokenized.
+        '''
+        kinds, texts = DStoken.split_date(date_string)
+        return list(zip(kinds, texts))
+        
+    @staticmethod
+    def split_date(date_string):
+        '''Splits a date string into tokens as described by tokenize_date.
+        Returns two lists of the same length: one with the kind of each
+        token and one with the text of each token.
+        
+        :param date_string: The date string to be split.
+        '''
+        
+        # Split the string with a compiled pattern and look up each token's kind using its first character
+        texts = DStoken.TOKEN_PATTERN.findall(date_string)
+        kindof = DStoken.CHARACTER_KINDS.get
+        decorator = DStoken.KIND_DECORATOR
+        kinds = [kindof(text[0], decorator) for text in texts]
+        if DStoken.KIND_TIMEZONE not in kinds:
+            return kinds, texts
+        return DStoken.join_timezones(kinds, texts)
+        
+    @staticmethod
+    def join_timezones(kinds, texts):
+        '''Finishes splitting a date string by joining '+' and '-' tokens
+        with the four-digit numbers after them into timezone tokens, as
+        described by tokenize_date. The '+' and '-' tokens that aren't
+        joined become decorator tokens.
+        Returns two lists like split_date.
+        
+        :param kinds: The kind of each token, with KIND_TIMEZONE for each
+            '+' or '-' token. Can be modified.
+        :param texts: The text of each token.
+        '''
+        retkinds = []
+        rettexts = []
+        
+        # '+' or '-' followed by a four-digit number become timezone tokens, unless they follow a number or another timezone token. Otherwise they become decorator tokens.
+        tokens_count = len(texts)
+        i = 0
+        while i < tokens_count:
+            if kinds[i] == DStoken.KIND_TIMEZONE:
+                check_prev = i == 0 or (kinds[i-1] != DStoken.KIND_NUMBER and kinds[i-1] != DStoken.KIND_TIMEZONE)
+                check_next = i < tokens_count-1 and kinds[i+1] == DStoken.KIND_NUMBER and len(texts[i+1]) == DStoken.TIMEZONE_LENGTH
+                if check_prev and check_next:
+                    retkinds.append(DStoken.KIND_TIMEZONE)
+                    rettexts.append(texts[i] + texts[i+1])
+                    i += 2
+                    continue
+                kinds[i] = DStoken.KIND_DECORATOR
+            retkinds.append(kinds[i])
+            rettexts.append(texts[i])
+            i += 1
+            
+        # All done!
+        return retkinds, rettexts
+        
+    @staticmethod
+    def tokenize_date_by_char(date_string):
+        '''Tokenizes a date string one character at a time.
+        This is the original, slower implementation of tokenize_date, kept
+        as a reference for testing that tokenize_date gives identical
+        output.
+        Returns a list of DStoken objects.
+        
         :param date_string: The date string to be tokenized.
         '''
         
@@ -191,6 +286,18 @@ class DStoken(object):
         
     # Convenience functions for doing useful operations on sets of token possibilities  
         
+    @staticmethod
+    def get_kinds_and_texts(date_tokens):
+        '''Returns a list of (kind, text) tuples for a tokenized date string.
+        
+        :param date_tokens: A list of DStoken objects returned by
+            tokenize_date, or of (kind, text) tuples returned by
+            tokenize_date_compact. Lists of tuples are returned as-is.
+        '''
+        if date_tokens and isinstance(date_tokens[0], DStoken):
+            return [(tok.kind, tok.text) for tok in date_tokens]
+        return date_tokens
+        
     @staticmethod
     def get_token_with_text(toklist, text):
         '''Returns the first token in a set matching the specified text.
@@ -10,21 +10,37 @@ make regarding the formatting of its input, take a look at the
 documentation for DSoptions.py.
 '''
 
+import sys
+
 from .DStoken import DStoken
 from .DSrule import *
 from .DSoptions import DSoptions
+from .DSbatch import detect_formats_for_columns
+from .DScache import DSFormatCache
+from .DSregistry import DSFormatRegistry
+from .DSparser import DSparser
+from .DSbitset import DSbitset
+from .DSmemo import DSRuleMemo
+from .DSstats import DSstats
+from .DSsample import DSsampler
+from .DSscan import detect_format_for_file
+
+# The asynchronous API uses syntax that's only there in Python 3.6 and later
+if sys.version_info >= (3, 6):
+    from .DSasync import detect_format_async
 
 __version__ = '1.0.1'
 '''DateSense version number'''
 
-def detect_format( dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None ):
+def detect_format( dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None, dedupe=False, converge=False, budget=None, cache=None, columnar=False, bitset=False, memo=None, stats=None, sampler=None ):
     '''Initialize and process everything for a data set in one convenient
     method. (Recommended you use this unless you're sure of what you're
     doing.)
     Returns a DSoptions object containing date format information.
     
     :param dates: A set of identically-formatted date strings for which
-        the formatting should be detected.
+        the formatting should be detected. Can be any iterable of strings,
+        including a generator; it's only iterated over once.
     :param formatRules: (optional) A set of rule objects such as those
         found in DSrule.py which inform the parser of what assumptions it
         should make regarding how input data will normally be formatted.
@@ -40,7 +56,56 @@ def detect_format( dates, formatRules=None, numOptions=None, wordOptions=None, t
         directive to use for them. (You probably want this to be '%z'.)
         Defaults to the value returned by
         DSoptions.get_default_tzoffsetdirective().
+    :param dedupe: (optional) If True, repeated date strings and repeated
+        token values are skipped while culling, so the work done scales
+        with the number of distinct values instead of the number of date
+        strings. Defaults to False.
+    :param converge: (optional) If True, culling switches to a cheaper mode
+        once the token possibilities stop changing, with identical results.
+        Defaults to False.
+    :param budget: (optional) If set, stop reading date strings once this
+        many have been used. The returned object's get_convergence_report
+        method tells how settled the result was. Defaults to None, meaning
+        all of them are used.
+    :param cache: (optional) A DSFormatCache or DSFormatRegistry object.
+        If the culled data looks just like something the cache has seen
+        before with the same parser options, the cached result is used
+        instead of applying the rules again. Defaults to None, meaning no
+        cache is used.
+    :param columnar: (optional) If True, date strings are culled many at a
+        time using the distinct values found at each position, which is
+        much faster when they all have the same layout. Defaults to False.
+    :param bitset: (optional) If True, the possibilities are culled as
+        bitmasks, which is faster for lots of date strings and gives the
+        same result. Defaults to False.
+    :param memo: (optional) A DSRuleMemo object. Rules whose inputs are
+        the same as when the memo last saw them, for example because they
+        only depend on which possibilities are where, aren't applied again.
+        Defaults to None, meaning every rule is applied.
+    :param stats: (optional) A DSstats object. How long each phase and
+        each rule took, how much each rule changed the scores, and what
+        culling removed are recorded in it. Defaults to None, meaning
+        nothing is measured.
+    :param sampler: (optional) A DSsampler object. Only a random sample of
+        the date strings, of the size it was created with, is culled, and
+        its get_report method tells whether that was enough to settle the
+        format. Defaults to None, meaning all of them are culled.
     '''
-    return DSoptions.detect_format( dates, formatRules, numOptions, wordOptions, tzOffsetDirective )
+    return DSoptions.detect_format( dates, formatRules, numOptions, wordOptions, tzOffsetDirective, dedupe, converge, budget, cache, columnar, bitset, memo, stats, sampler )
+
+def detect_formats( dates, formatRules=None, numOptions=None, wordOptions=None, tzOffsetDirective=None ):
+    '''Initialize and process everything for a data set that may contain
+    more than one date format. Date strings are grouped by the kinds of
+    tokens they contain and the format is detected for each group.
+    Returns a list of (DSoptions, count) tuples, one for each group, where
+    count is the number of date strings in that group, ordered from the
+    most common group to the least common.
     
-    
\ No newline at end of file
+    :param dates: A set of date strings for which the formatting should be
+        detected. Can be any iterable of strings, including a generator.
+    :param formatRules: (optional) See detect_format.
+    :param numOptions: (optional) See detect_format.
+    :param wordOptions: (optional) See detect_format.
+    :param tzOffsetDirective: (optional) See detect_format.
+    '''
+    return DSoptions.detect_formats( dates, formatRules, numOptions, wordOptions, tzOffsetDirective )
@@ -0,0 +1,204 @@
+'''Benchmarks for DateSense package
+Run this file to run all of the benchmarks, or pass the names of the
+ones you want to run as arguments, like:
+python DateSenseBenchmark.py tokenize
+The phases benchmark prints a line of JSON for each corpus and size. Pass
+numbers as arguments to choose the sizes, like:
+python DateSenseBenchmark.py phases 1000 1000000 10000000
+'''
+
+
+
+import DateSense
+from datetime import datetime, timedelta
+import itertools
+import json
+import random
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+
+def gendates(count, dateformat, start=datetime(2013, 4, 15, 14, 4, 11), step=timedelta(minutes=37, seconds=11)):
+    '''Make a list of date strings, evenly spaced in time'''
+    return [datetime.strftime(start + step*i, dateformat) for i in range(count)]
+
+# Formats from DateSenseUnitTest.py, used to generate the corpora for the phases benchmark
+CORPUS_FORMATS = (
+    "i I %Y", "%m/%d/%y %H:%M", "%a %b %d %H:%M:%S %Y", "%Y-%m-%d %H:%M:%S", "%Y, %b %d",
+    "%A, %d. %B %Y %I:%M%p", "The day is %d, the month is %B, the time is %I:%M%p",
+    "%Y-%m-%dT%H:%M:%S", "%d.%m.%Y", "%b %B %a %A %p", "%b %B %a %A %A %A %p",
+    "%Y %I %M %d %p %B", "%G-W%V", "%G-W%V-%u", "%G-%j", "%m-%d-%Y", "%d/%m/%Y %H:%M %z"
+)
+
+# A long, verbose format with lots of tokens
+LONG_FORMAT = "On %A, the %d day of the month of %B in the year %Y, at %I o'clock and %M minutes and %S seconds %p, " * 4
+
+SIZES = (1000, 10000)
+
+# The phases whose work grows with the number of date strings, so rows/sec means something for them
+ROW_PHASES = ('tokenize_date', 'cull_with_dates')
+
+def gencorpus(count, dateformat=None, seed=0):
+    '''Make a list of date strings at random times. If there's no format,
+    every date string uses a different one of CORPUS_FORMATS in turn.'''
+    generator = random.Random(seed)
+    start = datetime(1990, 1, 1)
+    dates = []
+    for i in range(count):
+        moment = start + timedelta(seconds=generator.randint(0, 40 * 365 * 86400))
+        dates.append(datetime.strftime(moment, dateformat or CORPUS_FORMATS[i % len(CORPUS_FORMATS)]))
+    return dates
+
+def besttime(func, repeat=3):
+    '''Returns the best time in seconds out of several calls to a function'''
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def report(name, rows, seconds, baseline=None):
+    '''Print the throughput for a benchmark, and the speedup over a baseline time if there is one'''
+    line = "%-48s %10d rows %12.0f rows/sec" % (name, rows, rows / seconds)
+    if baseline:
+        line += " %6.2fx" % (baseline / seconds)
+    print(line)
+
+
+
+def bench_tokenize():
+    '''Compare DStoken.tokenize_date against the original character-by-character tokenizer'''
+    for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %H:%M:%S %Y", "%d/%m/%Y %H:%M %z", "The day is %d, the month is %B, the time is %I:%M%p"):
+        dates = gendates(20000, case)
+        slow = besttime(lambda: [DateSense.DStoken.tokenize_date_by_char(date) for date in dates])
+        fast = besttime(lambda: [DateSense.DStoken.tokenize_date(date) for date in dates])
+        report("tokenize_date_by_char '" + case + "'", len(dates), slow)
+        report("tokenize_date '" + case + "'", len(dates), fast, slow)
+
+def bench_cull():
+    '''Compare culling with DStoken objects against culling with compact (kind, text) tuples, columnar culling and bitset culling'''
+    for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %H:%M:%S %Y"):
+        dates = gendates(20000, case)
+        def cull(tokenize):
+            options = DateSense.DSoptions(DateSense.DSoptions.get_default_rules(), DateSense.DSoptions.get_default_numoptions(), DateSense.DSoptions.get_default_wordoptions(), DateSense.DSoptions.get_default_tzoffsetdirective())
+            options.init_with_date_tokens(tokenize(dates[0]))
+            for date in dates:
+                options.cull_with_date_tokens(tokenize(date))
+        def cull_columnar():
+            options = DateSense.DSoptions.create_with_defaults()
+            options.initialize(dates, columnar=True)
+        full = besttime(lambda: cull(DateSense.DStoken.tokenize_date))
+        compact = besttime(lambda: cull(DateSense.DStoken.tokenize_date_compact))
+        def cull_bitset():
+            options = DateSense.DSoptions.create_with_defaults()
+            options.initialize(dates, bitset=True)
+        columnar = besttime(cull_columnar)
+        bitset = besttime(cull_bitset)
+        report("cull with DStoken '" + case + "'", len(dates), full)
+        report("cull with tuples '" + case + "'", len(dates), compact, full)
+        report("cull columnar '" + case + "'", len(dates), columnar, full)
+        report("cull bitset '" + case + "'", len(dates), bitset, full)
+
+def bench_parse():
+    '''Compare DSoptions.parse_all against calling datetime.strptime for each date string'''
+    for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %I:%M:%S %p %Y", "%d/%m/%Y %H:%M +0100"):
+        dates = gendates(20000, case)
+        options = DateSense.detect_format(dates[:1000])
+        format_string = str(options)
+        parser = options.get_parser()
+        slow = besttime(lambda: [datetime.strptime(date, format_string) for date in dates])
+        fast = besttime(lambda: parser.parse_all(dates))
+        report("strptime '" + case + "'", len(dates), slow)
+        report("parse_all '" + case + "'", len(dates), fast, slow)
+        try:
+            import numpy
+        except ImportError:
+            continue
+        report("parse_all_array '" + case + "'", len(dates), besttime(lambda: parser.parse_all_array(dates)), slow)
+
+def bench_long_strings():
+    '''Time apply_rules on long verbose date strings, to check that it scales linearly with the number of tokens'''
+    words = ("at", "the", "day", "is", "on", "Monday", "May", "of", "year", "time", "pm", "W")
+    for count in (50, 100, 200, 400, 800, 1600):
+        # Build a string of count tokens by mixing words, numbers and delimiters
+        parts = []
+        for i in range(count // 2):
+            parts.append(words[i % len(words)] if i % 3 else str(i % 60))
+            parts.append(" :-/"[i % 4])
+        date = "".join(parts)
+        options = DateSense.DSoptions.create_with_defaults()
+        options.initialize(date)
+        seconds = besttime(lambda: options.apply_rules(options.formatrules))
+        print("%-48s %10d tokens %12.3f ms %10.2f us/token" % ("apply_rules on long string", len(options.allowed), seconds * 1000, seconds * 1e6 / len(options.allowed)))
+
+
+def run_phases(dates):
+    '''Detect the format of some date strings one phase at a time.
+    Returns a dict of the seconds spent in each phase.'''
+    seconds = {}
+    def timed(name, func):
+        begin = timeit.default_timer()
+        func()
+        seconds[name] = timeit.default_timer() - begin
+    # Tokenizing on its own, without keeping the tokens around
+    def tokenize():
+        for date in dates:
+            DateSense.DStoken.tokenize_date_compact(date)
+    timed('tokenize_date', tokenize)
+    options = DateSense.DSoptions.create_with_defaults()
+    timed('init_with_date_tokens', lambda: options.init_with_date_tokens(DateSense.DStoken.tokenize_date_compact(dates[0])))
+    timed('cull_with_dates', lambda: options.cull_with_dates(itertools.islice(dates, 1, None)))
+    timed('cull_decorators', options.cull_decorators)
+    timed('apply_rules', lambda: options.apply_rules(options.formatrules))
+    timed('penalize_duplicates', lambda: options.penalize_duplicates(-2))
+    # And processing it again with a DSRuleMemo that's already seen it
+    memo = DateSense.DSRuleMemo()
+    repeat = DateSense.DSoptions.from_state(options.get_state())
+    repeat.process(memo=memo)
+    repeat = DateSense.DSoptions.from_state(options.get_state())
+    timed('process_memo', lambda: repeat.process(memo=memo))
+    return seconds
+
+def bench_phases(sizes=SIZES):
+    '''Time each phase of format detection for a corpus of every format in CORPUS_FORMATS, a mixture of them, and long verbose date strings, and print the results as JSON'''
+    corpora = [(dateformat, dateformat) for dateformat in CORPUS_FORMATS] + [('mixed', None), ('long', LONG_FORMAT)]
+    for size in sizes:
+        for name, dateformat in corpora:
+            dates = gencorpus(size, dateformat)
+            seconds = run_phases(dates)
+            result = {
+                'corpus': name, 'rows': size,
+                'seconds': seconds,
+                'rows_per_sec': dict([(phase, size / seconds[phase] if seconds[phase] else None) for phase in ROW_PHASES])
+            }
+            # Measure memory on a separate run, since tracing slows everything down; the corpus was made before tracing started, so it isn't counted
+            if tracemalloc is not None:
+                tracemalloc.start()
+                run_phases(dates)
+                result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            print(json.dumps(result, sort_keys=True))
+
+
+
+BENCHMARKS = {
+    'tokenize': bench_tokenize,
+    'cull': bench_cull,
+    'long': bench_long_strings,
+    'parse': bench_parse,
+    'phases': bench_phases
+}
+
+
+
+if __name__ == '__main__':
+    print("DateSense version: " + DateSense.__version__)
+    names = [arg for arg in sys.argv[1:] if not arg.isdigit()]
+    sizes = [int(arg) for arg in sys.argv[1:] if arg.isdigit()] or SIZES
+    for name in (names or sorted(BENCHMARKS)):
+        if name == 'phases':
+            bench_phases(sizes)
+        else:
+            BENCHMARKS[name]()
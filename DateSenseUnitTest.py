@@ -3,9 +3,21 @@
 
 
 import DateSense
-from datetime import datetime
+from datetime import datetime, timedelta
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 
 class Datetest(object):
@@ -149,6 +161,605 @@ class TestDateSense(unittest.TestCase):
     def test_23(self):
         '''Movies are not dates, make sure a blank string is returned'''
         assert Datetest( data=("2001: A Space Odyssey", "2010: The Year We Make Contact") , expected="" ).run()
+        
+    def test_24(self):
+        '''Accept a generator as input, consumed one date string at a time'''
+        dates = Datetest.gendata(Datetest.defaultData, "%Y-%m-%d %H:%M:%S")
+        assert Datetest( data=(date for date in dates), expected="%Y-%m-%d %H:%M:%S" ).run()
+        
+    def test_25(self):
+        '''Make sure empty input gives a blank string instead of an exception'''
+        assert Datetest( data=iter(()), expected="" ).run()
+        
+    def test_26(self):
+        '''Deduplicated culling should end up exactly where regular culling does'''
+        dates = Datetest.gendata(Datetest.defaultData, "%a %b %d %H:%M:%S %Y") * 50
+        plain = DateSense.detect_format(dates)
+        deduped = DateSense.detect_format(dates, dedupe=True)
+        assert deduped.get_format_string() == "%a %b %d %H:%M:%S %Y"
+        assert deduped.numranges == plain.numranges
+        assert deduped.get_long_debug_string() == plain.get_long_debug_string()
+        
+    def test_27(self):
+        '''Converged culling should end up exactly where regular culling does'''
+        moments = [datetime(2013, 1, 1) + timedelta(minutes=37*i) for i in range(2000)]
+        dates = Datetest.gendata(moments, "%d/%m/%Y %H:%M")
+        plain = DateSense.detect_format(dates)
+        converged = DateSense.detect_format(dates, converge=True)
+        assert converged.get_format_string() == "%d/%m/%Y %H:%M"
+        assert converged.get_convergence_report()['converged_at'] is not None
+        assert converged.numranges == plain.numranges
+        assert converged.get_long_debug_string() == plain.get_long_debug_string()
+        # Options that don't accept a whole range of numbers can still be ruled out by a value inside the range seen
+        class Even(DateSense.DSoptions.NumOption):
+            def includesvalue(self, value):
+                return value % 2 == 0
+        options = DateSense.DSoptions.get_default_numoptions() + (Even('%E', DateSense.DSoptions.COMMON, (0, 100)),)
+        dates = [str(2 * (i % 50)) for i in range(600)] + ["51"]
+        plain = DateSense.DSoptions.create_with_defaults(numOptions=options)
+        plain.initialize(dates)
+        converged = DateSense.DSoptions.create_with_defaults(numOptions=options)
+        converged.initialize(dates, converge=True)
+        assert converged.convergedrow is not None
+        assert '%E' not in converged.get_long_debug_string()
+        assert converged.numranges == plain.numranges
+        assert converged.get_long_debug_string() == plain.get_long_debug_string()
+        
+    def test_28(self):
+        '''Stop after the sample budget and report that the input wasn't exhausted'''
+        moments = [datetime(2013, 1, 1) + timedelta(hours=5*i) for i in range(1000)]
+        dates = Datetest.gendata(moments, "%Y-%m-%d %H:%M:%S")
+        options = DateSense.detect_format(iter(dates), budget=100)
+        report = options.get_convergence_report()
+        assert options.get_format_string() == "%Y-%m-%d %H:%M:%S"
+        assert report['rows'] == 100 and not report['exhausted']
+        assert 0.0 < report['confidence'] < 1.0
+        assert DateSense.detect_format(dates).get_convergence_report()['confidence'] == 1.0
+        
+    def test_29(self):
+        '''The compiled pattern tokenizer should give identical output to the character-by-character one'''
+        corpus = [
+            "", "12 34Abc?+1000", "+0100, -0300, GMT-0900", "2014-01-01", "-2014", "--0100", "+-0100",
+            "+0100-0300", "12+0100", "+010", "+01000", "a+0100", "Mon, 15 Apr 2013 14:04:11 -0700",
+            "2013-04-15T14:04:11+02:00", "  \t..::", "caf\u00e9 10h30", "%Y%m%d", "+", "-", "0"
+        ]
+        for case in ("%a %b %d %H:%M:%S %Y", "%A, %d. %B %Y %I:%M%p", "%G-W%V-%u", "%Y-%m-%dT%H:%M:%S"):
+            corpus.extend(Datetest.gendata(Datetest.defaultData, case))
+        for date in corpus:
+            fast = [(tok.kind, tok.text) for tok in DateSense.DStoken.tokenize_date(date)]
+            slow = [(tok.kind, tok.text) for tok in DateSense.DStoken.tokenize_date_by_char(date)]
+            assert fast == slow, date
+            
+    def test_30(self):
+        '''Compact date tokens should match DStoken objects and work the same way for culling'''
+        assert not hasattr(DateSense.DStoken(DateSense.DStoken.KIND_WORD, 'Apr'), '__dict__')
+        dates = Datetest.gendata(Datetest.defaultData, "%A, %d. %B %Y %I:%M%p +0100")
+        for date in dates:
+            compact = DateSense.DStoken.tokenize_date_compact(date)
+            assert compact == [(tok.kind, tok.text) for tok in DateSense.DStoken.tokenize_date(date)]
+        full = DateSense.DSoptions(DateSense.DSoptions.get_default_rules(), DateSense.DSoptions.get_default_numoptions(), DateSense.DSoptions.get_default_wordoptions(), DateSense.DSoptions.get_default_tzoffsetdirective())
+        full.init_with_date_tokens(DateSense.DStoken.tokenize_date(dates[0]))
+        for date in dates:
+            full.cull_with_date_tokens(DateSense.DStoken.tokenize_date(date))
+        full.cull_decorators()
+        full.process()
+        assert full.get_long_debug_string() == DateSense.detect_format(dates).get_long_debug_string()
+        
+    def test_31(self):
+        '''Detect each format in a column that mixes formats, with the number of date strings in each'''
+        iso = Datetest.gendata(Datetest.defaultData, "%Y-%m-%d %H:%M:%S")
+        verbose = Datetest.gendata(Datetest.defaultData, "%a %b %d %H:%M:%S %Y")
+        mixed = iso + verbose + iso[:2] + ["Do you see what happens"]
+        results = DateSense.detect_formats(mixed)
+        formats = [(options.get_format_string(), count) for options, count in results]
+        assert formats[:2] == [("%Y-%m-%d %H:%M:%S", 5), ("%a %b %d %H:%M:%S %Y", 3)]
+        assert formats[2:] == [("", 1)]
+        
+    def test_32(self):
+        '''Detect formats for many columns at once, using processes, threads, or neither'''
+        cases = ("%Y-%m-%d %H:%M:%S", "%a %b %d %H:%M:%S %Y", "%d.%m.%Y", "%G-W%V-%u", "%m/%d/%y %H:%M")
+        columns = dict([("column" + str(i), Datetest.gendata(Datetest.defaultData, case)) for i, case in enumerate(cases)])
+        columns["generator"] = (date for date in Datetest.gendata(Datetest.defaultData, "%d %b %Y"))
+        expected = dict([("column" + str(i), case) for i, case in enumerate(cases)])
+        expected["generator"] = "%d %b %Y"
+        results = DateSense.detect_formats_for_columns(columns, workers=2)
+        assert dict([(key, str(options)) for key, options in results.items()]) == expected
+        del columns["generator"], expected["generator"]
+        for workers, threads in ((2, True), (1, False)):
+            results = DateSense.detect_formats_for_columns(columns, workers=workers, threads=threads)
+            assert dict([(key, str(options)) for key, options in results.items()]) == expected
+            
+    def test_33(self):
+        '''Merging culled state from shards should give the same result as a single pass'''
+        moments = [datetime(2013, 1, 1) + timedelta(hours=7*i) for i in range(600)]
+        for case in ("%d/%m/%Y %H:%M", "%a %b %d %H:%M:%S %Y +0100"):
+            dates = Datetest.gendata(moments, case)
+            single = DateSense.detect_format(dates)
+            shards = []
+            for start in range(0, len(dates), 150):
+                shard = DateSense.DSoptions.create_with_defaults()
+                shard.initialize(dates[start:start+150])
+                shards.append(DateSense.DSoptions.from_state(json.loads(json.dumps(shard.get_state()))))
+            merged = shards[0]
+            for shard in shards[1:]:
+                merged = DateSense.DSoptions.merge(merged, shard)
+            merged = DateSense.DSoptions.merge(merged, DateSense.DSoptions.create_with_defaults())
+            merged.process()
+            assert merged.get_format_string() == single.get_format_string()
+            assert merged.numranges == single.numranges
+            assert merged.rows == len(dates)
+            assert merged.get_long_debug_string() == single.get_long_debug_string()
+        # If the second shard's first date string is shorter, positions past its end aren't culled by the rest of it
+        first = DateSense.DSoptions.create_with_defaults()
+        first.initialize(["2013-01-05 10:00", "2013-01-06 11:00"])
+        second = DateSense.DSoptions.create_with_defaults()
+        second.initialize(["2013-01-07", "2013-01-08 pm:00"])
+        merged = DateSense.DSoptions.merge(first, second)
+        merged.process()
+        assert str(DateSense.detect_format(["2013-01-05 10:00", "2013-01-06 11:00", "2013-01-07", "2013-01-08 pm:00"])) == ''
+        assert str(merged) == "%Y-%m-%d %y:%M"
+            
+    def test_34(self):
+        '''Repeat detections with a cache should reuse cached results and evict the least recently used'''
+        cache = DateSense.DSFormatCache(maxsize=2)
+        first = Datetest.gendata(Datetest.defaultData, "%a %b %d %H:%M:%S %Y")
+        other = Datetest.gendata(Datetest.defaultData, "%d.%m.%Y")
+        uncached = DateSense.detect_format(first)
+        assert DateSense.detect_format(first, cache=cache).get_long_debug_string() == uncached.get_long_debug_string()
+        cached = DateSense.detect_format(list(reversed(first)), cache=cache)
+        assert cached.get_long_debug_string() == uncached.get_long_debug_string()
+        assert cache.get_stats() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2}
+        DateSense.detect_format(other, cache=cache)
+        DateSense.detect_format(first, formatRules=DateSense.DSoptions.get_default_rules()[:-1], cache=cache)
+        assert len(cache) == 2
+        assert str(DateSense.detect_format(first, cache=cache)) == "%a %b %d %H:%M:%S %Y"
+        assert cache.get_stats()['hits'] == 1
+            
+    def test_35(self):
+        '''Results stored in a format registry should be found again after reopening it, with equivalent parser options'''
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "formats.db")
+            dates = Datetest.gendata(Datetest.defaultData, "%a %b %d %H:%M:%S %Y")
+            registry = DateSense.DSFormatRegistry(path)
+            uncached = DateSense.detect_format(dates, cache=registry)
+            assert registry.get_stats() == {'hits': 0, 'misses': 1, 'size': 1}
+            registry.close()
+            registry = DateSense.DSFormatRegistry(path)
+            rules = copy.deepcopy(DateSense.DSoptions.get_default_rules())
+            cached = DateSense.detect_format(dates, formatRules=rules, cache=registry)
+            assert cached.get_long_debug_string() == uncached.get_long_debug_string()
+            assert registry.get_formats() == [("%a %b %d %H:%M:%S %Y", 1.0)]
+            rules[0].posscore += 1
+            DateSense.detect_format(dates, formatRules=rules, cache=registry)
+            assert registry.get_stats() == {'hits': 1, 'misses': 1, 'size': 2}
+            registry.close()
+        finally:
+            shutil.rmtree(directory)
+            
+    def test_36(self):
+        '''Bulk parsing with the detected format should give the same results as strptime'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(300)]
+        for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %I:%M:%S %p %Y", "%d %B %Y  %H:%M", "%m/%d/%y %H:%M", "%d/%m/%Y %H:%M +0100"):
+            dates = Datetest.gendata(moments, case)
+            options = DateSense.detect_format(dates)
+            assert options.get_parser().pattern is not None
+            expected = [datetime.strptime(date, str(options)) for date in dates]
+            assert options.parse_all(dates) == expected
+            assert options.parse_all(dates[:5], epoch=True) == [DateSense.DSparser.get_epoch(moment) for moment in expected[:5]]
+        assert DateSense.DSparser.get_epoch(datetime.strptime("1970-01-02 01:00 +0100", "%Y-%m-%d %H:%M %z")) == 86400
+        # Directives without a fast path, and values strptime rejects, should be left to strptime
+        parser = DateSense.DSparser([DateSense.DStoken.create_number(DateSense.DSoptions.dir_Y), DateSense.DStoken.create_decorator('-'), DateSense.DStoken.create_number(DateSense.DSoptions.dir_j)])
+        assert parser.pattern is None
+        assert parser.parse_all(["2013-105"]) == [datetime.strptime("2013-105", parser.format_string)]
+        self.assertRaises(ValueError, options.parse_all, ["31/02/2013 10:00 +0100"])
+        self.assertRaises(ValueError, options.parse_all, ["31/01/2013 10:00 +0100 "])
+        # There's no parser when there's no format string
+        for dates in (["hello"], ["x-y"], [""]):
+            options = DateSense.detect_format(dates)
+            assert options.get_format_string() == '' and options.get_parser() is None
+            self.assertRaises(ValueError, options.parse_all, dates)
+            
+    @unittest.skipIf(numpy is None, "requires numpy")
+    def test_37(self):
+        '''Parsing into NumPy arrays should give the same results as bulk parsing, with or without a fixed-width layout'''
+        moments = [datetime(1969, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(300)]
+        for case, fixed in (("%Y-%m-%d %H:%M:%S", True), ("%d/%m/%Y %H:%M -0130", True), ("%a %b %d %I:%M:%S %p %Y", False)):
+            dates = Datetest.gendata(moments, case)
+            options = DateSense.detect_format(dates)
+            assert (options.get_parser().get_array_seconds(dates, numpy) is not None) == fixed
+            seconds = options.parse_all_array(dates, epoch=True)
+            assert seconds.dtype == numpy.int64
+            assert seconds.tolist() == options.parse_all(dates, epoch=True)
+            assert (options.parse_all_array(dates) == seconds.astype('datetime64[s]')).all()
+        # Rows that don't fit the layout of the first should fall back to parse_all
+        options = DateSense.detect_format(["2013-01-05 10:00:00"])
+        assert options.parse_all_array(["2013-01-05 10:00:00", "2013-1-05 10:00:00"]).tolist() == options.parse_all_array(["2013-01-05 10:00:00"]*2).tolist()
+        self.assertRaises(ValueError, options.parse_all_array, ["2013-01-05 10:00:00", "2013-02-30 10:00:00"])
+            
+    def test_38(self):
+        '''Columnar culling should give exactly the same possibilities and numeric ranges as culling one date string at a time'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(600)]
+        for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %H:%M:%S %Y", "%d/%m/%Y %H:%M +0100", "%B %d, %Y"):
+            dates = Datetest.gendata(moments, case)
+            for budget in (None, 100):
+                single = DateSense.DSoptions.create_with_defaults()
+                single.initialize(dates, budget=budget)
+                columnar = DateSense.DSoptions.create_with_defaults()
+                columnar.initialize(dates, budget=budget, columnar=True)
+                assert columnar.get_long_debug_string() == single.get_long_debug_string()
+                assert columnar.numranges == single.numranges
+                assert (columnar.rows, columnar.exhausted) == (single.rows, single.exhausted)
+        # Mixed layouts, and values that rule out every numeric directive, depend on the order so they're culled one at a time
+        for dates in (["5", "40", "100", "20000", "7"], ["12 x", "12 5", "Jan 5"]):
+            single = DateSense.DSoptions.create_with_defaults()
+            single.initialize(dates)
+            columnar = DateSense.DSoptions.create_with_defaults()
+            columnar.initialize(dates[:1])
+            assert columnar.cull_with_column(dates[1:]) > 0
+            columnar.cull_decorators()
+            assert columnar.get_long_debug_string() == single.get_long_debug_string()
+            assert columnar.numranges == single.numranges
+        # Options that don't accept a whole range of numbers have to be checked against every value
+        class Even(DateSense.DSoptions.NumOption):
+            def includesvalue(self, value):
+                return value % 2 == 0
+        options = (Even('%E', DateSense.DSoptions.COMMON, (0, 100)),)
+        for dates in (["2", "4", "5", "6"], ["2", "4", "6", "8"]):
+            single = DateSense.DSoptions.create_with_defaults(numOptions=options)
+            single.initialize(dates)
+            for bitset in (False, True):
+                columnar = DateSense.DSoptions.create_with_defaults(numOptions=options)
+                columnar.initialize(dates, columnar=True, bitset=bitset)
+                assert columnar.get_long_debug_string() == single.get_long_debug_string()
+                assert columnar.numranges == single.numranges
+        assert single.numranges == [[2, 8]]
+            
+    def test_39(self):
+        '''Looking up word options in a WordIndex should give the same results as calling includesvalue for each one'''
+        class Uppercase(DateSense.DSoptions.WordOption):
+            def includesvalue(self, value):
+                return value.isupper()
+        options = DateSense.DSoptions.get_default_wordoptions() + (
+            DateSense.DSoptions.WordOption('%B', DateSense.DSoptions.COMMON, ('january','february','march'), 3),
+            Uppercase('%Z', DateSense.DSoptions.UNCOMMON, ())
+        )
+        index = DateSense.DSoptions.WordIndex(options)
+        for value in ("Jan", "JANU", "janua", "januaryx", "Ma", "mar", "Marc", "PM", "pm", "Sunday", "sun", "ja", "", "UTC", "x"):
+            assert index.get_options(value) == tuple([option for option in options if option.includesvalue(value)])
+        dates = ["Janu 5", "Februa 9", "MARCH 15"]
+        assert str(DateSense.detect_format(dates, wordOptions=options)) == "%B %d"
+            
+    def test_40(self):
+        '''Looking up numeric options in a NumIndex should give the same results as calling includesvalue for each one'''
+        class Even(DateSense.DSoptions.NumOption):
+            def includesvalue(self, value):
+                return value % 2 == 0
+        options = DateSense.DSoptions.get_default_numoptions() + (
+            DateSense.DSoptions.NumOption('%Q', DateSense.DSoptions.UNCOMMON, (100, 200)),
+            DateSense.DSoptions.NumOption('%R', DateSense.DSoptions.UNCOMMON, (0.5, 12.5)),
+            Even('%E', DateSense.DSoptions.UNCOMMON, None)
+        )
+        index = DateSense.DSoptions.NumIndex(options)
+        for value in list(range(-2, 402)) + [9999, 10000, 123456]:
+            assert index.get_options(value) == tuple([option for option in options if option.includesvalue(value)])
+        dates = ["150 7", "199 61", "100 8"]
+        single = DateSense.detect_format(dates, numOptions=options)
+        assert str(single).startswith("%Q ")
+        assert single.numranges == [[100, 199], None, [7, 61]]
+            
+    def test_41(self):
+        '''Culling with a DSbitset should give exactly the same possibilities, numeric ranges and row counts as culling DStoken lists'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(300)]
+        datasets = [Datetest.gendata(moments, case) for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %I:%M:%S %p %Y", "%d/%m/%Y %H:%M +0100")]
+        datasets += [["5", "40", "100", "20000", "7"], ["12 x", "12 5", "Jan 5"], ["2013-01-05", "2013-01-05 10:00", "13-1-5"], []]
+        for dates in datasets:
+            for budget in (None, 100):
+                lists = DateSense.DSoptions.create_with_defaults()
+                lists.initialize(dates, budget=budget)
+                bitset = DateSense.DSoptions.create_with_defaults()
+                bitset.initialize(dates, budget=budget, bitset=True)
+                assert bitset.get_long_debug_string() == lists.get_long_debug_string()
+                assert bitset.numranges == lists.numranges
+                assert (bitset.rows, bitset.stablerows, bitset.exhausted) == (lists.rows, lists.stablerows, lists.exhausted)
+        assert str(DateSense.detect_format(datasets[1], bitset=True)) == "%a %b %d %I:%M:%S %p %Y"
+        # Words past the size of the cache should still get the right bits, just without being remembered
+        size = DateSense.DSbitset.WORD_MASK_CACHE_SIZE
+        try:
+            DateSense.DSbitset.WORD_MASK_CACHE_SIZE = 2
+            engine = DateSense.DSbitset(DateSense.DSoptions.create_with_defaults())
+            engine.initialize(datasets[1])
+            assert len(engine.wordmasks) == 2
+            bitset = DateSense.DSoptions.create_with_defaults()
+            bitset.initialize(datasets[1], bitset=True)
+        finally:
+            DateSense.DSbitset.WORD_MASK_CACHE_SIZE = size
+        lists = DateSense.DSoptions.create_with_defaults()
+        lists.initialize(datasets[1])
+        assert bitset.get_long_debug_string() == lists.get_long_debug_string()
+            
+    def test_42(self):
+        '''Updating with one date string at a time should give the same format as detecting it for all of them so far'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(200)]
+        dates = Datetest.gendata(moments, "%d/%m/%Y %H:%M")
+        options = DateSense.DSoptions.create_with_defaults()
+        assert options.update(dates[0])
+        for i in range(1, len(dates)):
+            options.update(dates[i])
+            if i in (1, 5, 199):
+                expected = DateSense.detect_format(dates[:i+1])
+                assert options.get_current_options().get_long_debug_string() == expected.get_long_debug_string()
+                assert options.current_format() == str(expected)
+        # Date strings that don't change anything shouldn't make it process again
+        current = options.get_current_options()
+        assert not options.update(dates[10])
+        assert options.get_current_options() is current
+        assert options.update("31/12/2099 23:59")
+        assert options.get_current_options() is not current
+        assert options.current_format() == "%d/%m/%Y %H:%M"
+        # Asking for a different duplicate penalty should process it again
+        current = options.get_current_options()
+        penalized = options.get_current_options(-5)
+        assert penalized is not current
+        expected = DateSense.DSoptions.from_state(options.get_state())
+        expected.cull_decorators()
+        expected.process(-5)
+        assert penalized.get_long_debug_string() == expected.get_long_debug_string()
+        assert options.get_current_options(-5) is penalized
+        
+    def test_43(self):
+        '''Reusing the changes rules made last time with a DSRuleMemo should give exactly the same scores as applying them'''
+        memo = DateSense.DSRuleMemo()
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(100)]
+        for case in ("%Y-%m-%d %H:%M:%S", "%a %b %d %I:%M %p %Y", "%d/%m/%Y %H:%M +0100"):
+            dates = Datetest.gendata(moments, case)
+            for count in (1, 2, 100, 100):
+                expected = DateSense.detect_format(dates[:count])
+                options = DateSense.detect_format(dates[:count], memo=memo)
+                assert options.get_long_debug_string() == expected.get_long_debug_string()
+        # Processing the same data again shouldn't need to apply any of the rules
+        stats = memo.get_stats()
+        assert stats['hits'] > 0 and stats['size'] <= stats['maxsize']
+        misses = stats['misses']
+        options = DateSense.detect_format(Datetest.gendata(moments, "%d/%m/%Y %H:%M +0100"), memo=memo)
+        assert memo.get_stats()['misses'] == misses
+        # Only the rules that look at numranges or scores need to be applied when just numranges change
+        options.numranges = [[numrange[0], numrange[1] + 1] if numrange else None for numrange in options.numranges]
+        options.set_scores([[DateSense.DStoken(tok.kind, tok.text, tok.option).score for tok in toklist] for toklist in options.allowed])
+        options.apply_rules(options.formatrules, memo)
+        assert 0 < memo.get_stats()['misses'] - misses < len(options.formatrules)
+        memo.clear()
+        assert memo.get_stats()['size'] == 0
+        
+    def test_44(self):
+        '''Collecting stats shouldn't change the result, and should measure every phase and rule'''
+        events = []
+        stats = DateSense.DSstats(callback=lambda kind, values: events.append(kind))
+        dates = Datetest.gendata(Datetest.defaultData, "%Y-%m-%d %H:%M:%S")
+        expected = DateSense.detect_format(dates)
+        for bitset in (False, True):
+            stats.clear()
+            options = DateSense.detect_format(dates, stats=stats, bitset=bitset)
+            assert options.get_long_debug_string() == expected.get_long_debug_string()
+            report = stats.get_report()
+            assert sorted(report['phases']) == ['apply_rules', 'cull', 'cull_decorators', 'init', 'penalize_duplicates']
+            assert len(report['rules']) == len(options.formatrules)
+            assert report['rows'] == 3 and report['settledrow'] <= 3
+            # Everything that was removed at each position should add up to what was there to begin with
+            seeded = DateSense.DSoptions.create_with_defaults()
+            seeded.init_with_date_tokens(DateSense.DStoken.tokenize_date(dates[0]))
+            assert [len(toklist) for toklist in seeded.allowed] == [len(toklist) + removed for toklist, removed in zip(options.allowed, report['removed'])]
+            json.dumps(report)
+        # Applying the rules to the result again should change the scores the same way as before
+        total = sum([totals['delta'] for totals in stats.rules.values()])
+        stats.clear()
+        options.set_scores([[DateSense.DStoken(tok.kind, tok.text, tok.option).score for tok in toklist] for toklist in options.allowed])
+        options.apply_rules(options.formatrules)
+        assert sum([totals['delta'] for totals in stats.rules.values()]) == total
+        assert set(events) == set(['phase', 'rule', 'culling'])
+        
+    def test_45(self):
+        '''Culling a random sample should find the format, and report whether it was enough'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=i % 400, minutes=97*i) for i in range(5000)]
+        dates = Datetest.gendata(moments, "%d/%m/%Y %H:%M")
+        sampler = DateSense.DSsampler(500)
+        options = DateSense.detect_format(dates, sampler=sampler)
+        assert str(options) == "%d/%m/%Y %H:%M"
+        report = sampler.get_report()
+        assert report['read'] == 5000 and report['culled'] == 500 and options.rows == 500
+        assert report['settled'] and not options.exhausted
+        assert sampler.retained[0] == dates[0] and len(sampler.retained) == report['retained']
+        # The same seed should choose the same sample
+        again = DateSense.DSsampler(500)
+        assert DateSense.detect_format(dates, sampler=again).get_long_debug_string() == options.get_long_debug_string()
+        assert again.retained == sampler.retained
+        # A budget bigger than the input culls all of it, same as without sampling
+        options = DateSense.detect_format(dates[:300], sampler=sampler)
+        assert options.get_long_debug_string() == DateSense.detect_format(dates[:300]).get_long_debug_string()
+        assert options.exhausted and sampler.get_report()['confidence'] == 1.0
+        # Reading only part of the input can't be exhausted, and patience stops culling early
+        sampler = DateSense.DSsampler(500, limit=100, patience=10)
+        options = DateSense.detect_format(dates, sampler=sampler)
+        report = sampler.get_report()
+        assert report['read'] == 100 and report['culled'] < 100 and report['stable_rows'] == 10
+        assert not options.exhausted
+        # A sample of just the first date string can't be enough when there are more
+        sampler = DateSense.DSsampler(1)
+        options = DateSense.detect_format(dates, sampler=sampler)
+        report = sampler.get_report()
+        assert report['culled'] == 1 and report['read'] > 1
+        assert not options.exhausted and not report['settled'] and report['confidence'] < 1.0
+        sampler = DateSense.DSsampler(1)
+        DateSense.detect_format(dates[:1], sampler=sampler)
+        assert sampler.get_report()['confidence'] == 1.0
+        self.assertRaises(ValueError, DateSense.DSsampler, 0)
+        # Rows retained by one sample should be culled by the next, so a rare row that rules out '%m' isn't left to chance
+        dates = [datetime(2013, 1+i%12, 1+i%12, i%24, i%60).strftime("%d/%m/%Y %H:%M") for i in range(3000)]
+        dates[1700] = "13/01/2013 10:00"
+        full = DateSense.DSsampler(len(dates))
+        assert str(DateSense.detect_format(dates, sampler=full)) == "%d/%m/%Y %H:%M"
+        assert "13/01/2013 10:00" in full.retained
+        assert str(DateSense.detect_format(dates, sampler=DateSense.DSsampler(20))) == "%m/%d/%Y %H:%M"
+        sampler = DateSense.DSsampler(20, retained=full.retained)
+        options = DateSense.detect_format(dates, sampler=sampler)
+        assert str(options) == "%d/%m/%Y %H:%M"
+        report = sampler.get_report()
+        assert report['culled'] == 20 and report['sampled'] == 20 - len(full.retained) and options.rows == 20
+        # They don't count as part of the input, so culling all of it is still exhausted
+        sampler = DateSense.DSsampler(len(dates), retained=full.retained)
+        assert DateSense.detect_format(dates[:300], sampler=sampler).exhausted
+        
+    def test_46(self):
+        '''Scanning a column of a memory-mapped file should give the same result as detecting the format of its date strings'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(300)]
+        cases = ("%d/%m/%Y %H:%M", "%b %d, %Y %I:%M %p", "%Y-%m-%dT%H:%M:%S+0100")
+        columns = [Datetest.gendata(moments, case) for case in cases]
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "dates.csv")
+            with open(path, "wb") as datafile:
+                datafile.write(b"id,first,second,third\r\n")
+                for i in range(len(moments)):
+                    datafile.write((str(i) + "," + columns[0][i] + ',"' + columns[1][i] + '",' + columns[2][i] + "\r\n").encode("ascii"))
+            for column in range(len(cases)):
+                expected = DateSense.detect_format(columns[column])
+                for bitset in (False, True):
+                    options = DateSense.detect_format_for_file(path, column + 1, skiprows=1, bitset=bitset)
+                    assert options.get_long_debug_string() == expected.get_long_debug_string()
+                    assert options.rows == len(moments)
+            options = DateSense.detect_format_for_file(path, 1, skiprows=1, budget=10, dedupe=True)
+            assert options.rows == 10 and not options.exhausted
+            # Each whole line, and an empty file
+            path = os.path.join(directory, "dates.log")
+            with open(path, "wb") as datafile:
+                datafile.write("\n".join(columns[2]).encode("ascii"))
+            assert str(DateSense.detect_format_for_file(path)) == str(DateSense.detect_format(columns[2]))
+            path = os.path.join(directory, "empty.log")
+            open(path, "wb").close()
+            assert str(DateSense.detect_format_for_file(path)) == ""
+        finally:
+            shutil.rmtree(directory)
+        
+    def test_47(self):
+        '''Scanning byte ranges of a file in parallel and merging them should give the same result as scanning it all at once'''
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(400)]
+        dates = Datetest.gendata(moments, "%b %d, %Y %I:%M %p")
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "dates.csv")
+            with open(path, "wb") as datafile:
+                datafile.write(b"id,date\n")
+                for i in range(len(dates)):
+                    datafile.write((str(i) + ',"' + dates[i] + '"\n').encode("ascii"))
+            # The ranges should cover everything after the header, and each should begin at the beginning of a line
+            chunks = DateSense.DSscan.get_chunks(path, 5, skiprows=1)
+            assert len(chunks) == 5 and chunks[0][0] == len(b"id,date\n") and chunks[-1][1] == os.path.getsize(path)
+            with open(path, "rb") as datafile:
+                data = datafile.read()
+            assert all([data[start-1:start] == b"\n" for start, end in chunks])
+            assert all([chunks[i][1] == chunks[i+1][0] for i in range(len(chunks)-1)])
+            expected = DateSense.detect_format_for_file(path, 1, skiprows=1)
+            for bitset in (False, True):
+                options = DateSense.detect_format_for_file(path, 1, skiprows=1, bitset=bitset, workers=2)
+                assert options.get_long_debug_string() == expected.get_long_debug_string()
+                assert options.rows == len(dates)
+            # The budget should never be overshot, even when there are more ranges than it allows for
+            for budget in (3, 10, 101):
+                options = DateSense.detect_format_for_file(path, 1, skiprows=1, budget=budget, workers=3)
+                assert options.rows == budget and not options.exhausted
+            # Ranges that start with a shorter date string than the file's first should still give the same result
+            lines = ["2013-01-05 10:00\n"] * 320
+            with open(path, "wb") as datafile:
+                datafile.write("".join(lines).encode("ascii"))
+            # Every line is the same length, so where the ranges begin doesn't depend on what's in them
+            starts = [start // len(lines[0]) for start, end in DateSense.DSscan.get_chunks(path, 8)]
+            for i in range(160, len(lines)):
+                lines[i] = "2013-01-08 pm:00\n" if i - 1 in starts else "2013-01-00000007\n"
+            with open(path, "wb") as datafile:
+                datafile.write("".join(lines).encode("ascii"))
+            expected = DateSense.detect_format_for_file(path)
+            assert str(expected) == ''
+            options = DateSense.detect_format_for_file(path, workers=2)
+            assert options.get_long_debug_string() == expected.get_long_debug_string()
+            assert options.rows == len(lines)
+        finally:
+            shutil.rmtree(directory)
+        
+    @unittest.skipIf(sys.version_info < (3, 6), "requires Python 3.6")
+    def test_48(self):
+        '''Detecting the format of an asynchronous stream should give the same result as the regular way, and let other coroutines run'''
+        import asyncio
+        class AsyncDates(object):
+            def __init__(self, dates, loop):
+                self.dates = iter(dates)
+                self.loop = loop
+                self.read = 0
+            def __aiter__(self):
+                return self
+            def __anext__(self):
+                future = self.loop.create_future()
+                date = next(self.dates, None)
+                self.read += date is not None
+                if date is None:
+                    future.set_exception(StopAsyncIteration())
+                else:
+                    future.set_result(date)
+                return future
+        moments = [datetime(2013, 1, 1) + timedelta(days=3*i, minutes=97*i) for i in range(200)]
+        dates = Datetest.gendata(moments, "%a %b %d %H:%M:%S %Y")
+        expected = DateSense.detect_format(dates)
+        loop = asyncio.new_event_loop()
+        try:
+            # Count how many times another callback gets to run while detecting
+            ticks = []
+            def tick():
+                ticks.append(True)
+                loop.call_soon(tick)
+            loop.call_soon(tick)
+            options = loop.run_until_complete(DateSense.detect_format_async(AsyncDates(dates, loop), chunksize=16))
+            assert options.get_long_debug_string() == expected.get_long_debug_string()
+            assert options.rows == len(dates) and len(ticks) >= len(dates) // 16
+            options = loop.run_until_complete(DateSense.detect_format_async(dates, budget=50, chunksize=16))
+            assert options.get_long_debug_string() == DateSense.detect_format(dates, budget=50).get_long_debug_string()
+            assert options.rows == 50 and not options.exhausted
+            # Only one date string past the budget should be read, to find out there were more, same as for a regular iterable
+            stream = AsyncDates(dates, loop)
+            options = loop.run_until_complete(DateSense.detect_format_async(stream, budget=50, chunksize=16))
+            assert options.rows == 50 and not options.exhausted and stream.read == 51
+            options = loop.run_until_complete(DateSense.detect_format_async(dates[0]))
+            assert options.get_long_debug_string() == DateSense.detect_format(dates[0]).get_long_debug_string()
+        finally:
+            loop.close()
+        
+    def test_49(self):
+        '''Format registry keys for custom rules should be the same in every process, or refuse to be made'''
+        script = (
+            "import DateSense\n"
+            "class SetRule(object):\n"
+            "    def __init__(self): self.directives = set(['%d', '%m', '%H', '%M', '%S', '%Y', '%b'])\n"
+            "    def apply(self, options): pass\n"
+            "options = DateSense.DSoptions.create_with_defaults([SetRule()])\n"
+            "print(DateSense.DSFormatRegistry.get_config_signature(options, -2))\n"
+        )
+        signatures = set()
+        for seed in ("1", "2", "3"):
+            environment = dict(os.environ, PYTHONHASHSEED=seed)
+            signatures.add(subprocess.check_output([sys.executable, "-c", script], env=environment))
+        assert len(signatures) == 1
+        # Objects with the default repr can't be described, unless they have a get_signature method
+        class Thing(object):
+            pass
+        class ObjectRule(object):
+            def __init__(self, thing):
+                self.thing = thing
+            def apply(self, options):
+                pass
+        options = DateSense.DSoptions.create_with_defaults([ObjectRule(Thing())])
+        self.assertRaises(ValueError, DateSense.DSFormatRegistry.get_config_signature, options, -2)
+        Thing.get_signature = lambda thing: "thing"
+        first = DateSense.DSFormatRegistry.get_config_signature(options, -2)
+        options = DateSense.DSoptions.create_with_defaults([ObjectRule(Thing())])
+        assert DateSense.DSFormatRegistry.get_config_signature(options, -2) == first
     
     
     